@@ -1,4 +1,5 @@
 from django.contrib import admin
+from . import search
 from .models import Post, Group, Comment
 
 
@@ -8,6 +9,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по полнотекстовому индексу вместо LIKE по всем постам.
+        if not search_term:
+            return queryset, False
+        return search.matching(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("title", "description")
@@ -0,0 +1,111 @@
+"""JSON API лент только для чтения, с курсорами и ETag."""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_safe
+
+from . import follow_graph, freshness, timeline
+from .models import Group, Post
+from .paginator import CursorPaginator
+
+User = get_user_model()
+
+VERSION = "v1"
+
+
+def serialize(post):
+    return {
+        "id": post.pk,
+        "text": post.text,
+        "pub_date": post.pub_date.isoformat(),
+        "author": post.author.username,
+        "group": post.group.slug if post.group_id else None,
+        "image": post.image.url if post.image else None,
+        "comments": post.comments_count,
+        "version": post.version,
+    }
+
+
+def feed_response(request, posts, **ordering):
+    paginator = CursorPaginator(posts, settings.API_PAGE_SIZE, **ordering)
+    page = paginator.get_page(request.GET.get("cursor"))
+
+    def link(cursor):
+        if cursor is None:
+            return None
+        return f"{request.path}?{urlencode({'cursor': cursor})}"
+
+    return JsonResponse(
+        {
+            "results": [serialize(post) for post in page],
+            "next": link(page.next_cursor),
+            "previous": link(page.previous_cursor),
+        },
+        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")},
+    )
+
+
+def feed_etag(request, *scopes):
+    return freshness.etag(
+        VERSION, request.get_full_path(), scopes=["all", *scopes]
+    )
+
+
+def unauthorized():
+    return JsonResponse({"error": "Требуется авторизация"}, status=401)
+
+
+@require_safe
+@condition(etag_func=lambda request: feed_etag(request, "index"))
+def index(request):
+    return feed_response(request, Post.objects.for_feed())
+
+
+def group_etag(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_etag(request, f"group:{group.pk}")
+
+
+@require_safe
+@condition(etag_func=group_etag)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(request, group.posts.for_feed())
+
+
+def profile_etag(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_etag(request, f"author:{author.pk}")
+
+
+@require_safe
+@condition(etag_func=profile_etag)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(request, author.posts.for_feed())
+
+
+def follow_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    user_id = request.user.pk
+    # Лента складывается из постов авторов из подписок: граф в памяти
+    # даёт их список без запроса к базе.
+    authors = follow_graph.get_graph().following(user_id)
+    return feed_etag(
+        request, f"follow:{user_id}",
+        *(f"author:{author_id}" for author_id in authors)
+    )
+
+
+@require_safe
+@condition(etag_func=follow_etag)
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return unauthorized()
+    return feed_response(
+        request, timeline.feed(request.user).for_feed(),
+        order_field="feed_date", tie_field="feed_post",
+    )
@@ -0,0 +1,265 @@
+"""Потоковые выгрузка и загрузка контента в JSONL, по объекту в строке."""
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from . import (
+    counters, feeds, follow_graph, freshness, recommendations, search,
+    sidebar, thumbnails, timeline
+)
+from .models import Comment, Follow, Group, Post
+from .page_cache import invalidate
+
+User = get_user_model()
+
+ID_MAP = "import_post_ids"
+
+EXPORT_FIELDS = {
+    "group": ("slug", "title", "description"),
+    "post": (
+        "id", "author__username", "group__slug", "text", "pub_date",
+        "image", "image_variants",
+    ),
+    "comment": ("post_id", "author__username", "text", "created"),
+    "follow": ("user__username", "author__username"),
+}
+
+RENAMED = {
+    "author__username": "author",
+    "user__username": "user",
+    "group__slug": "group",
+    "post_id": "post",
+}
+
+
+def _rows(model, queryset, chunk_size):
+    fields = EXPORT_FIELDS[model]
+    rows = queryset.order_by("pk").values_list(*fields)
+    for values in rows.iterator(chunk_size=chunk_size):
+        row = {"model": model}
+        for field, value in zip(fields, values):
+            if hasattr(value, "isoformat"):
+                value = value.isoformat()
+            row[RENAMED.get(field, field)] = value
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def export_lines(groups, posts, comments, follows, chunk_size=2000):
+    """Строки JSONL для переданных выборок, по одной на объект."""
+    yield from _rows("group", groups, chunk_size)
+    yield from _rows("post", posts, chunk_size)
+    yield from _rows("comment", comments, chunk_size)
+    yield from _rows("follow", follows, chunk_size)
+
+
+def export_all(chunk_size=2000):
+    return export_lines(
+        Group.objects.all(), Post.objects.all(), Comment.objects.all(),
+        Follow.objects.all(), chunk_size,
+    )
+
+
+def export_user(user, chunk_size=2000):
+    """Архив пользователя: его посты с комментариями и его подписки."""
+    return export_lines(
+        Group.objects.filter(pk__in=user.posts.values("group")),
+        user.posts.all(),
+        Comment.objects.filter(post__author=user),
+        Follow.objects.filter(user=user),
+        chunk_size,
+    )
+
+
+def _insert(model, objects):
+    """Вставляет объекты и проставляет им id, выданные базой."""
+    model.objects.bulk_create(objects)
+    # SQLite пишет одна транзакция за раз, а AUTOINCREMENT растёт:
+    # строки этой вставки — последние в таблице.
+    ids = list(model.objects.order_by("-pk").values_list(
+        "pk", flat=True
+    )[:len(objects)])
+    for obj, pk in zip(objects, reversed(ids)):
+        obj.pk = pk
+
+
+class Importer:
+    """Загружает строки архива пачками и запоминает замену id."""
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.users = {}
+        self.groups = {}
+        self.images = set()
+        self.followers = set()
+        self.counts = dict.fromkeys(EXPORT_FIELDS, 0)
+
+    def run(self, lines):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE {ID_MAP} "
+                "(archive_id INTEGER PRIMARY KEY, post_id INTEGER NOT NULL)"
+            )
+        try:
+            model, batch = None, []
+            for line in lines:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if row["model"] != model or len(batch) >= self.batch_size:
+                    self.flush(model, batch)
+                    model, batch = row["model"], []
+                batch.append(row)
+            self.flush(model, batch)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {ID_MAP}")
+        self.finish()
+        return self.counts
+
+    def flush(self, model, batch):
+        if not batch:
+            return
+        loader = getattr(self, f"load_{model}", None)
+        if loader is None:
+            raise ValueError(f"Неизвестная модель в архиве: {model}")
+        with transaction.atomic():
+            loader(batch)
+
+    def post_ids(self, archive_ids):
+        """Новые id постов по id из архива."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT archive_id, post_id FROM {ID_MAP} "
+                "WHERE archive_id IN (SELECT value FROM json_each(%s))",
+                [json.dumps(list(archive_ids))]
+            )
+            return dict(cursor.fetchall())
+
+    def user_ids(self, usernames):
+        """id пользователей по именам; недостающие создаются."""
+        missing = set(usernames).difference(self.users)
+        self.users.update(
+            User.objects.filter(username__in=missing)
+            .values_list("username", "pk")
+        )
+        missing.difference_update(self.users)
+        if missing:
+            new_users = [User(username=name) for name in missing]
+            for user in new_users:
+                user.set_unusable_password()
+            User.objects.bulk_create(new_users, ignore_conflicts=True)
+            self.users.update(
+                User.objects.filter(username__in=missing)
+                .values_list("username", "pk")
+            )
+        return self.users
+
+    def load_group(self, batch):
+        slugs = [row["slug"] for row in batch]
+        existing = set(
+            Group.objects.filter(slug__in=slugs)
+            .values_list("slug", flat=True)
+        )
+        Group.objects.bulk_create(
+            Group(
+                slug=row["slug"], title=row["title"],
+                description=row["description"],
+            )
+            for row in batch if row["slug"] not in existing
+        )
+        self.groups.update(
+            Group.objects.filter(slug__in=slugs).values_list("slug", "pk")
+        )
+        self.counts["group"] += len(slugs) - len(existing)
+
+    def load_post(self, batch):
+        users = self.user_ids(row["author"] for row in batch)
+        posts, dates = [], []
+        for row in batch:
+            post = Post(
+                author_id=users[row["author"]],
+                group_id=self.groups.get(row["group"]),
+                text=row["text"],
+                image=row["image"] or "",
+                image_variants=row["image_variants"] or "",
+            )
+            posts.append(post)
+            dates.append(parse_datetime(row["pub_date"]))
+            if post.image and not post.image_variants:
+                self.images.add(post.image.name)
+        _insert(Post, posts)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {ID_MAP} VALUES (%s, %s)",
+                [(row["id"], post.pk) for row, post in zip(batch, posts)]
+            )
+        # auto_now_add перезаписывает дату при вставке: возвращаем её.
+        for post, date in zip(posts, dates):
+            post.pub_date = date
+        Post.objects.bulk_update(posts, ["pub_date"])
+
+        author_ids = {post.author_id for post in posts}
+        counters.reconcile_users(list(author_ids))
+        search.reindex(post.pk for post in posts)
+        self.followers.update(
+            Follow.objects.filter(author__in=author_ids)
+            .values_list("user_id", flat=True)
+        )
+        self.counts["post"] += len(posts)
+
+    def load_comment(self, batch):
+        posts = self.post_ids({row["post"] for row in batch})
+        batch = [row for row in batch if row["post"] in posts]
+        users = self.user_ids(row["author"] for row in batch)
+        comments = [
+            Comment(
+                post_id=posts[row["post"]],
+                author_id=users[row["author"]],
+                text=row["text"],
+            )
+            for row in batch
+        ]
+        _insert(Comment, comments)
+        for comment, row in zip(comments, batch):
+            comment.created = parse_datetime(row["created"])
+        Comment.objects.bulk_update(comments, ["created"])
+        counters.reconcile_posts(
+            list({comment.post_id for comment in comments})
+        )
+        self.counts["comment"] += len(comments)
+
+    def load_follow(self, batch):
+        users = self.user_ids(
+            name for row in batch for name in (row["user"], row["author"])
+        )
+        follows = [
+            Follow(user_id=users[row["user"]], author_id=users[row["author"]])
+            for row in batch if row["user"] != row["author"]
+        ]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        touched = {follow.user_id for follow in follows}
+        touched.update(follow.author_id for follow in follows)
+        counters.reconcile_users(list(touched))
+        timeline.update_modes({follow.author_id for follow in follows})
+        recommendations.mark_stale(*(follow.user_id for follow in follows))
+        self.followers.update(follow.user_id for follow in follows)
+        self.counts["follow"] += len(follows)
+
+    def finish(self):
+        """Обновляет то, что сигналы сделали бы для каждого объекта."""
+        for user_id in sorted(self.followers):
+            timeline.rebuild(user_id)
+        if self.counts["follow"]:
+            follow_graph.reset()
+        thumbnails.submit_many(self.images)
+        sidebar.invalidate()
+        feeds.invalidate_all()
+        invalidate("index_page")
+        freshness.touch(["all"])
+
+
+def import_lines(lines, batch_size=500):
+    """Загружает строки архива; возвращает число новых объектов."""
+    return Importer(batch_size).run(lines)
@@ -0,0 +1,85 @@
+"""Денормализованные счётчики постов, комментариев и подписок."""
+from django.db.models import Count, F
+
+from .models import Comment, Follow, Post, UserStats
+
+USER_COUNTERS = {
+    "posts_count": (Post, "author_id"),
+    "followers_count": (Follow, "author_id"),
+    "followings_count": (Follow, "user_id"),
+}
+
+
+def change_user(user_id, field, delta):
+    stats = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats = stats.filter(**{f"{field}__gte": -delta})
+    updated = stats.update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        reconcile_users([user_id])
+
+
+def change_post(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F("comments_count") + delta)
+
+
+def for_user(user):
+    try:
+        return UserStats.objects.get(user=user)
+    except UserStats.DoesNotExist:
+        reconcile_users([user.pk])
+        return UserStats.objects.get(user=user)
+
+
+def _counts(model, key, ids):
+    rows = (
+        model.objects.filter(**{f"{key}__in": ids})
+        .order_by()
+        .values(key)
+        .annotate(total=Count("pk"))
+        .values_list(key, "total")
+    )
+    return dict(rows)
+
+
+def reconcile_users(user_ids):
+    """Пересчитывает счётчики пользователей, возвращает число исправлений."""
+    totals = {
+        field: _counts(model, key, user_ids)
+        for field, (model, key) in USER_COUNTERS.items()
+    }
+    existing = UserStats.objects.in_bulk(user_ids)
+    missing, changed = [], []
+    for user_id in user_ids:
+        stats = existing.get(user_id)
+        if stats is None:
+            stats = UserStats(user_id=user_id)
+            missing.append(stats)
+        elif all(
+            getattr(stats, field) == totals[field].get(user_id, 0)
+            for field in USER_COUNTERS
+        ):
+            continue
+        else:
+            changed.append(stats)
+        for field in USER_COUNTERS:
+            setattr(stats, field, totals[field].get(user_id, 0))
+    UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+    UserStats.objects.bulk_update(changed, list(USER_COUNTERS))
+    return len(missing) + len(changed)
+
+
+def reconcile_posts(post_ids):
+    """Пересчитывает счётчики комментариев, возвращает число исправлений."""
+    totals = _counts(Comment, "post_id", post_ids)
+    changed = []
+    for post in Post.objects.filter(pk__in=post_ids).only("comments_count"):
+        total = totals.get(post.pk, 0)
+        if post.comments_count != total:
+            post.comments_count = total
+            changed.append(post)
+    Post.objects.bulk_update(changed, ["comments_count"])
+    return len(changed)
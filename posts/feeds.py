@@ -0,0 +1,230 @@
+"""RSS и Atom для всех постов, сообществ и авторов."""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from yatube.routers import primary
+from . import freshness
+from .models import Group, Post
+from .page_cache import bump_generation, get_generation
+
+User = get_user_model()
+
+GENERATION = "feed_entries"
+
+
+def entries_key(scope):
+    return f"feed_entries:{get_generation(GENERATION)}:{scope}"
+
+
+def entry(post):
+    return {
+        "id": post.pk,
+        "text": post.text,
+        "author": post.author.get_full_name() or post.author.username,
+        "group": post.group.title if post.group_id else None,
+        "pub_date": post.pub_date,
+        "link": reverse("post", kwargs={
+            "username": post.author.username, "post_id": post.pk
+        }),
+    }
+
+
+@primary()
+def build(scope):
+    posts = Post.objects.for_feed()
+    kind, _, value = scope.partition(":")
+    if kind in freshness.FILTERS:
+        posts = posts.filter(**{freshness.FILTERS[kind]: int(value)})
+    return [entry(post) for post in posts[:settings.FEED_SIZE]]
+
+
+def get_entries(scope):
+    entries = cache.get(entries_key(scope))
+    if entries is None:
+        entries = build(scope)
+        cache.set(entries_key(scope), entries, settings.FEED_CACHE_TIMEOUT)
+    return entries
+
+
+def feed_scopes(post):
+    return {
+        scope for scope in freshness.post_scopes(
+            (post.pk, post.author_id, post.group_id)
+        )
+        if not scope.startswith("post:")
+    }
+
+
+def stamp_scopes(scopes):
+    """Области меток свежести для списков ``scopes``."""
+    return [f"feed:{scope}" for scope in scopes]
+
+
+def note_post(post):
+    """Дописывает новый пост в закешированные списки после коммита."""
+    freshness.touch(stamp_scopes(feed_scopes(post)))
+    transaction.on_commit(lambda: _note_post(post))
+
+
+def _note_post(post):
+    new = entry(post)
+    for scope in feed_scopes(post):
+        entries = cache.get(entries_key(scope))
+        if entries is None:
+            continue
+        entries = [new] + [
+            other for other in entries if other["id"] != post.pk
+        ]
+        cache.set(
+            entries_key(scope), entries[:settings.FEED_SIZE],
+            settings.FEED_CACHE_TIMEOUT
+        )
+
+
+def _forget(scopes):
+    cache.delete_many([entries_key(scope) for scope in scopes])
+
+
+def invalidate(scopes):
+    scopes = list(scopes)
+    freshness.touch(stamp_scopes(scopes))
+    _forget(scopes)
+    transaction.on_commit(lambda: _forget(scopes))
+
+
+def invalidate_all():
+    bump_generation(GENERATION)
+    transaction.on_commit(lambda: bump_generation(GENERATION))
+
+
+class PostsFeed(Feed):
+    def items(self, obj):
+        return get_entries(self.scope(obj))
+
+    def item_title(self, item):
+        return Truncator(item["text"]).chars(60)
+
+    def item_description(self, item):
+        return item["text"]
+
+    def item_link(self, item):
+        return item["link"]
+
+    def item_guid(self, item):
+        return item["link"]
+
+    def item_pubdate(self, item):
+        return item["pub_date"]
+
+    def item_author_name(self, item):
+        return item["author"]
+
+    def item_categories(self, item):
+        return [item["group"]] if item["group"] else []
+
+
+class IndexFeed(PostsFeed):
+    description = "Последние записи всех авторов"
+
+    def title(self):
+        return f"{settings.SITE_NAME}: новые записи"
+
+    def link(self):
+        return reverse("index")
+
+    def scope(self, obj):
+        return "index"
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, obj):
+        return f"{settings.SITE_NAME}: {obj.title}"
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse("group", kwargs={"slug": obj.slug})
+
+    def scope(self, obj):
+        return f"group:{obj.pk}"
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return (
+            f"{settings.SITE_NAME}: {obj.get_full_name() or obj.username}"
+        )
+
+    def description(self, obj):
+        return f"Записи @{obj.username}"
+
+    def link(self, obj):
+        return reverse("profile", kwargs={"username": obj.username})
+
+    def scope(self, obj):
+        return f"author:{obj.pk}"
+
+
+class AtomMixin:
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self._get_dynamic_attr("description", obj)
+
+
+class IndexAtomFeed(AtomMixin, IndexFeed):
+    pass
+
+
+class GroupAtomFeed(AtomMixin, GroupFeed):
+    pass
+
+
+class AuthorAtomFeed(AtomMixin, AuthorFeed):
+    pass
+
+
+def index_scopes(request):
+    return stamp_scopes(["index"])
+
+
+def group_scopes(request, slug):
+    group = get_object_or_404(Group.objects.only("pk"), slug=slug)
+    return stamp_scopes([f"group:{group.pk}"])
+
+
+def author_scopes(request, username):
+    user = get_object_or_404(User.objects.only("pk"), username=username)
+    return stamp_scopes([f"author:{user.pk}"])
+
+
+def conditional_feed(feed, scopes_func):
+    """Оборачивает ленту в проверку меток свежести."""
+    def view(request, *args, **kwargs):
+        response = feed(request, *args, **kwargs)
+        # Дата самой новой записи не меняется при правках.
+        del response["Last-Modified"]
+        return response
+    return freshness.conditional_page(scopes_func, per_viewer=False)(view)
+
+
+index_rss = conditional_feed(IndexFeed(), index_scopes)
+index_atom = conditional_feed(IndexAtomFeed(), index_scopes)
+group_rss = conditional_feed(GroupFeed(), group_scopes)
+group_atom = conditional_feed(GroupAtomFeed(), group_scopes)
+author_rss = conditional_feed(AuthorFeed(), author_scopes)
+author_atom = conditional_feed(AuthorAtomFeed(), author_scopes)
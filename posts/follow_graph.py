@@ -0,0 +1,195 @@
+"""Граф подписок в памяти процесса, догоняемый по журналу в кеше."""
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from yatube.routers import primary
+from .models import Follow
+
+GENERATION_KEY = "follow_graph:generation"
+CHANGE_TIMEOUT = 60 * 60
+
+ADD, REMOVE = "add", "remove"
+
+_graph = None
+
+
+def change_key(generation):
+    return f"follow_graph:change:{generation}"
+
+
+def _index(items, value):
+    index = bisect_left(items, value)
+    if index < len(items) and items[index] == value:
+        return index
+    return None
+
+
+def _insert(items, value):
+    if _index(items, value) is None:
+        insort(items, value)
+
+
+def _discard(items, value):
+    index = _index(items, value)
+    if index is not None:
+        del items[index]
+
+
+class FollowGraph:
+    def __init__(self, generation=None):
+        self.generation = generation
+        self._following = {}
+        self._followers = {}
+
+    @classmethod
+    @primary()
+    def load(cls, generation=None, follows=None):
+        """Граф из базы; ``follows`` ограничивает его частью подписок."""
+        graph = cls(generation)
+        if follows is None:
+            follows = Follow.objects.all()
+        rows = follows.order_by("user_id", "author_id").values_list(
+            "user_id", "author_id"
+        )
+        # Строки отсортированы, поэтому массивы заполняются по порядку.
+        for user_id, author_id in rows.iterator():
+            graph._following.setdefault(user_id, array("q")).append(author_id)
+            graph._followers.setdefault(author_id, array("q")).append(user_id)
+        return graph
+
+    def add(self, user_id, author_id):
+        _insert(self._following.setdefault(user_id, array("q")), author_id)
+        _insert(self._followers.setdefault(author_id, array("q")), user_id)
+
+    def remove(self, user_id, author_id):
+        _discard(self._following.get(user_id, array("q")), author_id)
+        _discard(self._followers.get(author_id, array("q")), user_id)
+
+    def apply(self, operation, user_id, author_id):
+        if operation == ADD:
+            self.add(user_id, author_id)
+        else:
+            self.remove(user_id, author_id)
+
+    def is_following(self, user_id, author_id):
+        following = self._following.get(user_id)
+        return bool(following) and _index(following, author_id) is not None
+
+    def following(self, user_id):
+        """Отсортированные id авторов, на которых подписан пользователь."""
+        return tuple(self._following.get(user_id, ()))
+
+    def followers(self, author_id):
+        return tuple(self._followers.get(author_id, ()))
+
+    def following_count(self, user_id):
+        return len(self._following.get(user_id, ()))
+
+    def followers_count(self, author_id):
+        return len(self._followers.get(author_id, ()))
+
+    def mutuals(self, user_id):
+        """Пользователи, подписанные друг на друга с ``user_id``."""
+        following = self._following.get(user_id, ())
+        followers = self._followers.get(user_id, ())
+        return sorted(set(following).intersection(followers))
+
+    def edges(self):
+        for user_id, authors in self._following.items():
+            for author_id in authors:
+                yield user_id, author_id
+
+    def errors(self):
+        """Нарушения внутренней структуры: порядок, дубли, симметрия."""
+        problems = []
+        for name, adjacency in (
+            ("following", self._following), ("followers", self._followers)
+        ):
+            for node, items in adjacency.items():
+                if any(a >= b for a, b in zip(items, items[1:])):
+                    problems.append(f"{name}[{node}] не отсортирован")
+        reverse = {
+            (user_id, author_id)
+            for author_id, users in self._followers.items()
+            for user_id in users
+        }
+        if reverse != set(self.edges()):
+            problems.append("following и followers не симметричны")
+        return problems
+
+
+def get_graph():
+    """Граф процесса, догнанный до текущего поколения."""
+    global _graph
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Кеш очищен: журнал изменений потерян, начинаем заново.
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+        _graph = FollowGraph.load(generation)
+    elif _graph is None or _graph.generation > generation:
+        _graph = FollowGraph.load(generation)
+    elif _graph.generation < generation:
+        _catch_up(_graph, generation)
+    return _graph
+
+
+def _catch_up(graph, generation):
+    global _graph
+    missed = range(graph.generation + 1, generation + 1)
+    changes = {}
+    if len(missed) <= settings.FOLLOW_GRAPH_MAX_REPLAY:
+        changes = cache.get_many([change_key(number) for number in missed])
+    if len(changes) < len(missed):
+        _graph = FollowGraph.load(generation)
+        return
+    for number in missed:
+        graph.apply(*changes[change_key(number)])
+    graph.generation = generation
+
+
+def _publish(operation, user_id, author_id):
+    try:
+        generation = cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Поколения нет — все процессы и так перечитают граф.
+        return
+    cache.set(
+        change_key(generation), (operation, user_id, author_id),
+        CHANGE_TIMEOUT
+    )
+
+
+def record(operation, user_id, author_id):
+    """Применяет изменение к своему графу и публикует его после коммита."""
+    def apply():
+        if _graph is not None:
+            _graph.apply(operation, user_id, author_id)
+        _publish(operation, user_id, author_id)
+    transaction.on_commit(apply)
+
+
+def check(graph=None):
+    """Недостающие и лишние рёбра графа и нарушения его структуры."""
+    graph = graph or get_graph()
+    stored = set(
+        Follow.objects.values_list("user_id", "author_id").iterator()
+    )
+    loaded = set(graph.edges())
+    return sorted(stored - loaded), sorted(loaded - stored), graph.errors()
+
+
+def reset():
+    """Заставляет все процессы перечитать граф из базы."""
+    global _graph
+    try:
+        generation = cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+    # Изменения под этим номером нет: другие процессы загрузят граф.
+    _graph = FollowGraph.load(generation)
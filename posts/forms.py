@@ -1,5 +1,7 @@
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
+from .ingest import ingest
 from .models import Post, Comment
 
 User = get_user_model()
@@ -10,6 +12,12 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ['text', 'group', 'image']
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            return ingest(image)
+        return image
+
     def validate_form(self):
         data = self.cleaned_data['text']
         if data is None:
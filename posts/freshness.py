@@ -0,0 +1,148 @@
+"""Метки свежести лент и страниц для ETag и Last-Modified."""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.views.decorators.http import condition
+
+from yatube.routers import primary
+from .models import Post
+
+TIMEOUT = 60 * 60 * 24
+
+FILTERS = {"group": "group_id", "author": "author_id"}
+
+
+def stamp_key(scope):
+    return f"freshness:{scope}"
+
+
+def post_scopes(*posts):
+    """Области, в которых виден пост: его страница и ленты."""
+    scopes = {"index"}
+    for post_id, author_id, group_id in posts:
+        scopes.add(f"post:{post_id}")
+        scopes.add(f"author:{author_id}")
+        if group_id is not None:
+            scopes.add(f"group:{group_id}")
+    return scopes
+
+
+@primary()
+def _newest(scopes):
+    """Даты самых новых постов для областей без метки."""
+    newest = {}
+    by_kind = {}
+    # Метка ленты строится по той же дате, что и метка её области.
+    feeds = [scope for scope in scopes if scope.startswith("feed:")]
+    scopes = {scope.partition(":")[2] for scope in feeds}.union(
+        scope for scope in scopes if not scope.startswith("feed:")
+    )
+    for scope in scopes:
+        kind, _, value = scope.partition(":")
+        if kind == "index":
+            newest[scope] = Post.objects.aggregate(
+                newest=Max("pub_date")
+            )["newest"]
+        elif kind in FILTERS:
+            by_kind.setdefault(kind, []).append(int(value))
+    for kind, ids in by_kind.items():
+        field = FILTERS[kind]
+        rows = (
+            Post.objects.filter(**{f"{field}__in": ids}).order_by()
+            .values_list(field).annotate(newest=Max("pub_date"))
+        )
+        newest.update((f"{kind}:{pk}", value) for pk, value in rows)
+    for scope in feeds:
+        newest[scope] = newest.get(scope.partition(":")[2])
+    return newest
+
+
+def stamps(scopes):
+    """Метки областей; недостающие строятся и кладутся в кеш."""
+    keys = {stamp_key(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    missing = [scope for key, scope in keys.items() if key not in found]
+    newest = _newest(missing)
+    for scope in missing:
+        date = newest.get(scope)
+        value = (
+            date.isoformat() if date else None, time.time(), uuid.uuid4().hex
+        )
+        # Метку, построенную параллельно другим процессом, не затираем.
+        cache.add(stamp_key(scope), value, TIMEOUT)
+        found[stamp_key(scope)] = cache.get(stamp_key(scope), value)
+    return [found[stamp_key(scope)] for scope in scopes]
+
+
+def _digest(parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def etag(*parts, scopes):
+    """Сильный ETag из меток ``scopes`` и прочих частей ответа."""
+    return _digest([*parts, *stamps(scopes)])
+
+
+def last_modified(values):
+    """Время изменения или None, пока с новой метки не прошла секунда."""
+    modified = max(value[1] for value in values)
+    if int(time.time()) <= int(modified):
+        return None
+    return datetime.fromtimestamp(int(modified), timezone.utc)
+
+
+def viewer_parts(request):
+    """Части ответа, зависящие от того, кто смотрит страницу."""
+    return [
+        request.user.pk,
+        request.META.get("CSRF_COOKIE"),
+        request.get_full_path(),
+    ]
+
+
+def viewer_scopes(request):
+    if not request.user.is_authenticated:
+        return []
+    return [f"follow:{request.user.pk}"]
+
+
+def conditional_page(scopes_func, per_viewer=True):
+    """Отвечает 304 на повторный запрос страницы, не вызывая view."""
+    def state(request, *args, **kwargs):
+        cached = getattr(request, "_freshness", None)
+        if cached is None:
+            scopes = ["all", *scopes_func(request, *args, **kwargs)]
+            parts = [request.get_full_path()]
+            if per_viewer:
+                scopes += viewer_scopes(request)
+                parts = viewer_parts(request)
+            values = stamps(scopes)
+            cached = request._freshness = (
+                _digest([*parts, *values]), last_modified(values)
+            )
+        return cached
+
+    return condition(
+        etag_func=lambda *args, **kwargs: state(*args, **kwargs)[0],
+        last_modified_func=lambda *args, **kwargs: state(*args, **kwargs)[1],
+    )
+
+
+def _forget(scopes):
+    cache.delete_many([stamp_key(scope) for scope in scopes])
+
+
+def touch(scopes):
+    """Сбрасывает метки сейчас и после коммита, как ``invalidate``."""
+    scopes = list(scopes)
+    _forget(scopes)
+    transaction.on_commit(lambda: _forget(scopes))
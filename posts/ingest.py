@@ -0,0 +1,85 @@
+"""Проверка, очистка от метаданных и уменьшение загруженных картинок."""
+import os
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps, ImageSequence
+
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+
+
+def inspect(upload):
+    """Проверяет размер файла, формат и число пикселей по заголовку."""
+    if upload.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+        raise forms.ValidationError("Файл слишком большой")
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except (Image.DecompressionBombError, OSError):
+        raise forms.ValidationError("Не удалось прочитать изображение")
+    if image.format not in EXTENSIONS:
+        raise forms.ValidationError(f"Формат {image.format} не поддерживается")
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise forms.ValidationError("Слишком большое разрешение изображения")
+    return image
+
+
+def strip(image):
+    # Из метаданных нужна только прозрачность палитровых картинок.
+    image.info = {
+        key: value for key, value in image.info.items()
+        if key == "transparency"
+    }
+    return image
+
+
+def animation(image, limit):
+    """Уменьшенные кадры анимации без метаданных и параметры сохранения."""
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(image):
+        durations.append(frame.info.get("duration", 100))
+        frame = frame.copy()
+        frame.thumbnail((limit, limit), Image.LANCZOS)
+        frames.append(strip(frame))
+    return frames[0], {
+        "save_all": True,
+        "append_images": frames[1:],
+        "duration": durations,
+        "loop": image.info.get("loop", 0),
+    }
+
+
+def ingest(upload):
+    """Возвращает очищенную и уменьшенную копию загруженной картинки."""
+    image = inspect(upload)
+    image_format = image.format
+    limit = settings.IMAGE_MAX_SIDE
+    if getattr(image, "is_animated", False):
+        image, options = animation(image, limit)
+    else:
+        if image_format == "JPEG":
+            # JPEG умеет декодироваться сразу в уменьшенном масштабе.
+            image.draft("RGB", (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        options = {}
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    strip(image)
+
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    image.save(
+        output, image_format, quality=settings.IMAGE_QUALITY, optimize=True,
+        **options
+    )
+    size = output.tell()
+    output.seek(0)
+    name = os.path.splitext(upload.name)[0] + EXTENSIONS[image_format]
+    return UploadedFile(
+        output, name, Image.MIME[image_format], size, charset=None
+    )
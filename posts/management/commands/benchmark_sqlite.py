@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE post (
+    id INTEGER PRIMARY KEY,
+    author_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    pub_date REAL NOT NULL
+);
+CREATE INDEX post_author_pub_date ON post (author_id, pub_date);
+"""
+
+AUTHORS = 100
+
+
+def apply_pragmas(db, pragmas):
+    for name, value in pragmas.items():
+        db.execute(f"PRAGMA {name} = {value}")
+
+
+def prepare(path, pragmas, rows):
+    # Режим журнала сохраняется в файле базы, поэтому переключаем его
+    # один раз заранее, а не наперегонки из всех процессов.
+    with sqlite3.connect(path) as db:
+        apply_pragmas(db, pragmas)
+        db.executescript(SCHEMA)
+        db.executemany(
+            "INSERT INTO post (author_id, text, pub_date) VALUES (?, ?, ?)",
+            (
+                (random.randrange(AUTHORS), "x" * 200, time.time())
+                for _ in range(rows)
+            ),
+        )
+
+
+def worker(path, pragmas, seconds, write_ratio, results):
+    """Смешанная нагрузка: чтение ленты автора или вставка поста."""
+    db = sqlite3.connect(path)
+    apply_pragmas(db, pragmas)
+    reads = writes = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        author = random.randrange(AUTHORS)
+        try:
+            if random.random() < write_ratio:
+                with db:
+                    db.execute(
+                        "INSERT INTO post (author_id, text, pub_date) "
+                        "VALUES (?, ?, ?)",
+                        (author, "x" * 200, time.time()),
+                    )
+                writes += 1
+            else:
+                db.execute(
+                    "SELECT id, text FROM post WHERE author_id = ? "
+                    "ORDER BY pub_date DESC LIMIT 10",
+                    (author,),
+                ).fetchall()
+                reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    db.close()
+    results.put((reads, writes, errors))
+
+
+def run(path, pragmas, workers, seconds, write_ratio):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker,
+            args=(path, pragmas, seconds, write_ratio, results),
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    totals = [sum(column) for column in zip(
+        *(results.get() for _ in processes)
+    )]
+    for process in processes:
+        process.join()
+    return totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пропускную способность SQLite со стандартным журналом "
+        "и с прагмами из SQLITE_PRAGMAS под смешанной нагрузкой"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument(
+            "--write-ratio", type=float, default=0.2,
+            help="Доля операций записи, от 0 до 1"
+        )
+        parser.add_argument(
+            "--rows", type=int, default=10000,
+            help="Сколько постов создать перед замером"
+        )
+
+    def handle(self, *args, **options):
+        profiles = {
+            "default": {"busy_timeout": 5000},
+            "production": settings.SQLITE_PRAGMAS,
+        }
+        directory = tempfile.mkdtemp()
+        try:
+            for name, pragmas in profiles.items():
+                path = os.path.join(directory, f"{name}.sqlite3")
+                prepare(path, pragmas, options["rows"])
+                reads, writes, errors = run(
+                    path, pragmas, options["workers"],
+                    options["seconds"], options["write_ratio"],
+                )
+                self.stdout.write(
+                    f"{name}: {(reads + writes) / options['seconds']:.0f} "
+                    f"оп/с (чтений {reads}, записей {writes}, "
+                    f"ошибок блокировки {errors})"
+                )
+        finally:
+            shutil.rmtree(directory)
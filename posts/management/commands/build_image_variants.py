@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит миниатюры и варианты картинок для постов, "
+        "у которых их ещё нет"
+    )
+
+    def handle(self, *args, **options):
+        names = list(
+            Post.objects.exclude(image="").exclude(image__isnull=True)
+            .filter(image_variants="")
+            .values_list("image", flat=True).order_by().distinct()
+        )
+        if settings.THUMBNAIL_WORKERS:
+            list(thumbnails.get_executor().map(thumbnails.generate, names))
+        else:
+            for name in names:
+                thumbnails.generate(name)
+        self.stdout.write(f"Обработано картинок: {len(names)}")
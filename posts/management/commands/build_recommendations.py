@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает рекомендации «на кого подписаться»"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Пересчитать всех, а не только пользователей, "
+                 "чьи подписки менялись"
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            user_ids = User.objects.values_list("pk", flat=True)
+        else:
+            user_ids = recommendations.stale_users()
+        built = recommendations.build(
+            user_ids, batch_size=options["batch_size"],
+            whole_graph=options["all"],
+        )
+        self.stdout.write(f"Рекомендации пересчитаны: {built}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import follow_graph
+
+
+class Command(BaseCommand):
+    help = "Сверяет граф подписок в памяти с таблицей Follow"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair", action="store_true",
+            help="Перечитать граф из базы во всех процессах"
+        )
+
+    def handle(self, *args, **options):
+        missing, extra, errors = follow_graph.check()
+        for user_id, author_id in missing:
+            self.stdout.write(f"Нет в графе: {user_id} -> {author_id}")
+        for user_id, author_id in extra:
+            self.stdout.write(f"Лишняя в графе: {user_id} -> {author_id}")
+        for error in errors:
+            self.stdout.write(f"Ошибка структуры: {error}")
+        if options["repair"]:
+            follow_graph.reset()
+            self.stdout.write("Граф перечитан из базы")
+        elif missing or extra or errors:
+            raise CommandError(
+                f"Граф расходится с базой: нет {len(missing)}, "
+                f"лишних {len(extra)}, ошибок структуры {len(errors)}"
+            )
+        else:
+            self.stdout.write("Граф совпадает с базой")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnail_gc
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет миниатюры картинок, на которые не ссылается ни один пост, "
+        "и сверяет хранилище sorl-thumbnail с файлами на диске"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Только показать, что будет удалено"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Сколько источников обрабатывать в одной транзакции"
+        )
+
+    def handle(self, *args, **options):
+        report = thumbnail_gc.collect(
+            dry_run=options["dry_run"], batch_size=options["batch_size"]
+        )
+        if options["verbosity"] > 1:
+            for title, names in (
+                ("Источник без постов", report.orphan_sources),
+                ("Нет файла миниатюры", report.missing_files),
+                ("Лишний файл", report.stray_files),
+            ):
+                for name in names:
+                    self.stdout.write(f"{title}: {name}")
+        verb = "Найдено" if options["dry_run"] else "Удалено"
+        self.stdout.write(
+            f"{verb}: источников без постов {len(report.orphan_sources)}, "
+            f"записей без файлов {len(report.missing_files)}, "
+            f"лишних файлов {len(report.stray_files)}"
+        )
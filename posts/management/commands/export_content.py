@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = "Выгружает сообщества, посты, комментарии и подписки в JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default="-",
+            help="Файл для записи; по умолчанию стандартный вывод"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000,
+            help="Сколько строк читать из базы за один раз"
+        )
+
+    def handle(self, *args, **options):
+        lines = archive.export_all(options["chunk_size"])
+        if options["output"] == "-":
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(options["output"], "w", encoding="utf-8") as output:
+            output.writelines(lines)
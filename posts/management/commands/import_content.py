@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = "Загружает JSONL, выгруженный командой export_content"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input", nargs="?", default="-",
+            help="Файл архива; по умолчанию стандартный ввод"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Сколько объектов записывать в одной транзакции"
+        )
+
+    def handle(self, *args, **options):
+        if options["input"] == "-":
+            counts = archive.import_lines(sys.stdin, options["batch_size"])
+        else:
+            with open(options["input"], encoding="utf-8") as lines:
+                counts = archive.import_lines(lines, options["batch_size"])
+        self.stdout.write(
+            "Загружено: сообществ {group}, постов {post}, "
+            "комментариев {comment}, подписок {follow}".format(**counts)
+        )
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Пересобирает ленты «Избранных авторов» из подписок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "usernames", nargs="*",
+            help="Пересобрать только ленты этих пользователей"
+        )
+
+    def handle(self, *args, **options):
+        # Пользователи без подписок тоже пересобираются: у них могли
+        # остаться записи от старых подписок.
+        users = User.objects.filter(
+            Q(follower__isnull=False) | Q(timeline__isnull=False)
+        ).distinct()
+        if options["usernames"]:
+            users = User.objects.filter(username__in=options["usernames"])
+        count = 0
+        for user_id in users.values_list("id", flat=True).iterator():
+            timeline.rebuild(user_id)
+            count += 1
+        self.stdout.write(f"Пересобрано лент: {count}")
@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Post
+
+User = get_user_model()
+
+
+def batches(queryset, size):
+    ids = queryset.order_by("pk").values_list("pk", flat=True)
+    batch = []
+    for pk in ids.iterator():
+        batch.append(pk)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики постов, комментариев и подписок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Сколько объектов пересчитывать за один проход"
+        )
+
+    def handle(self, *args, **options):
+        size = options["batch_size"]
+        users = sum(
+            counters.reconcile_users(batch)
+            for batch in batches(User.objects.all(), size)
+        )
+        posts = sum(
+            counters.reconcile_posts(batch)
+            for batch in batches(Post.objects.all(), size)
+        )
+        self.stdout.write(
+            f"Исправлено счётчиков: пользователей {users}, постов {posts}"
+        )
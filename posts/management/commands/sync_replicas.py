@@ -0,0 +1,34 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+def copy_database(source, target):
+    """Копирует базу SQLite целиком через online backup API."""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную базу SQLite в реплики из DATABASE_REPLICAS. "
+        "Заменяет настоящую репликацию при локальной разработке"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=0,
+            help="Повторять копирование каждые N секунд"
+        )
+
+    def handle(self, *args, **options):
+        source = settings.DATABASES["default"]["NAME"]
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(source, settings.DATABASES[alias]["NAME"])
+                self.stdout.write(f"{alias}: скопирована")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.28 on 2026-10-17 02:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    comments = models.Subquery(
+        Post.objects.filter(pk=models.OuterRef('pk'))
+        .annotate(total=models.Count('comments'))
+        .values('total')
+    )
+    Post.objects.update(comments_count=comments)
+    # По запросу с группировкой на счётчик: соединение всех трёх таблиц
+    # с User дало бы произведение постов, подписчиков и подписок.
+    totals = {
+        field: dict(
+            model.objects.order_by().values(key)
+            .annotate(total=models.Count('id')).values_list(key, 'total')
+        )
+        for field, model, key in (
+            ('posts_count', Post, 'author'),
+            ('followers_count', Follow, 'author'),
+            ('followings_count', Follow, 'user'),
+        )
+    }
+    UserStats.objects.bulk_create(
+        UserStats(
+            user_id=user_id,
+            **{
+                field: counts.get(user_id, 0)
+                for field, counts in totals.items()
+            }
+        )
+        for user_id in User.objects.values_list('pk', flat=True).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('followers_count', models.PositiveIntegerField(default=0)),
+                ('followings_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
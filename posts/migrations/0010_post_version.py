@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0013_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE posts_search USING fts5("
+                "text, group_title, author, "
+                "tokenize='unicode61 remove_diacritics 2')",
+                "INSERT INTO posts_search (rowid, text, group_title, author) "
+                "SELECT p.id, p.text, COALESCE(g.title, ''), u.username "
+                "FROM posts_post p "
+                "JOIN auth_user u ON u.id = p.author_id "
+                "LEFT JOIN posts_group g ON g.id = p.group_id",
+            ],
+            reverse_sql="DROP TABLE posts_search",
+        ),
+    ]
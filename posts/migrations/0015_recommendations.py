@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-17 03:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0014_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='recommendations_stale',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_to', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['user', 'score', 'author'], name='recommendation_user_score'),
+        ),
+        migrations.AddConstraint(
+            model_name='recommendation',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_recommendation'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_recommendations'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userstats',
+            name='recommendations_stale',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-17 04:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pull_authors(apps, schema_editor):
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gt=settings.TIMELINE_PULL_THRESHOLD
+    ).update(timeline_pull=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_recommendations_stale_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='timeline_pull',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_pull_authors, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
+import json
+
 from django.db import models
+from django.db.models import F
 from django.contrib.auth import get_user_model
 
+from .storage import post_images
+
 User = get_user_model()
 
 
@@ -13,6 +18,14 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        return self.select_related("author", "group")
+
+    def bump_version(self):
+        return self.update(version=F("version") + 1)
+
+
 class Post(models.Model):
     text = models.TextField(
         help_text='Текст Вашей записи',
@@ -35,17 +48,39 @@ class Post(models.Model):
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=post_images,
         blank=True,
         null=True,
         verbose_name='Изображение'
     )
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    image_variants = models.TextField(blank=True, default="", editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=["author", "pub_date"],
+                name="post_author_pub_date",
+            ),
+            models.Index(
+                fields=["group", "pub_date"],
+                name="post_group_pub_date",
+            ),
+            models.Index(fields=["pub_date", "id"], name="post_pub_date_id"),
+        ]
 
     def __str__(self):
         return self.text
 
+    @property
+    def variants(self):
+        """Готовые варианты картинки: формат -> список размеров."""
+        return json.loads(self.image_variants) if self.image_variants else {}
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -67,6 +102,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=["post", "created"],
+                name="comment_post_created",
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -88,3 +129,80 @@ class Follow(models.Model):
                 name="unique_follow",
             )
         ]
+        indexes = [
+            models.Index(fields=["user", "author"], name="follow_user_author"),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries"
+    )
+    pub_date = models.DateTimeField("date_published")
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                name="unique_timeline_entry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "pub_date", "post"],
+                name="timeline_user_pub_date_post",
+            )
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats"
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    followings_count = models.PositiveIntegerField(default=0)
+    # Посты автора подмешиваются в ленты при чтении, а не раскладываются.
+    timeline_pull = models.BooleanField(default=False)
+    # Сколько раз подписки менялись после последнего расчёта
+    # рекомендаций; 0 — рекомендации актуальны.
+    recommendations_stale = models.PositiveIntegerField(default=1)
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="recommendations"
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="recommended_to"
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "author"],
+                name="unique_recommendation",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "score", "author"],
+                name="recommendation_user_score",
+            )
+        ]
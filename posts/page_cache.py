@@ -0,0 +1,87 @@
+"""Кеш страниц, сбрасываемый номером поколения, а не временем жизни."""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+
+from yatube.routers import primary
+
+LOCK_TIMEOUT = 30
+
+
+def generation_key(key_prefix):
+    return f"{key_prefix}:generation"
+
+
+def get_generation(key_prefix):
+    generation = cache.get(generation_key(key_prefix))
+    if generation is None:
+        cache.add(generation_key(key_prefix), 1, None)
+        generation = cache.get(generation_key(key_prefix), 1)
+    return generation
+
+
+def bump_generation(key_prefix):
+    try:
+        cache.incr(generation_key(key_prefix))
+    except ValueError:
+        cache.add(generation_key(key_prefix), 2, None)
+
+
+def invalidate(key_prefix):
+    """Сбрасывает поколение сейчас и ещё раз после фиксации."""
+    bump_generation(key_prefix)
+    transaction.on_commit(lambda: bump_generation(key_prefix))
+
+
+def page_key(key_prefix, request):
+    if request.user.is_authenticated:
+        variant = f"user.{request.user.pk}"
+    else:
+        variant = "anonymous"
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"{key_prefix}:{variant}:{path}"
+
+
+def generational_cache_page(timeout, key_prefix, stale_timeout=60):
+    """Кеширует GET-ответы view на ``timeout`` секунд в пределах поколения."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            key = page_key(key_prefix, request)
+            generation = get_generation(key_prefix)
+            entry = cache.get(key)
+            if entry is not None and entry["generation"] == generation \
+                    and entry["expires"] > time.time():
+                return entry["response"]
+
+            lock = f"{key}:lock"
+            locked = cache.add(lock, 1, LOCK_TIMEOUT)
+            if entry is not None and not locked:
+                return entry["response"]
+            try:
+                # Отстающая реплика пережила бы в кеше сброс поколения.
+                with primary():
+                    response = view(request, *args, **kwargs)
+                    if hasattr(response, "render"):
+                        response.render()
+                if response.status_code == 200 and not response.streaming:
+                    cache.set(
+                        key,
+                        {
+                            "generation": generation,
+                            "expires": time.time() + timeout,
+                            "response": response,
+                        },
+                        timeout + stale_timeout,
+                    )
+            finally:
+                if locked:
+                    cache.delete(lock)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,125 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_token(values):
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Разбирает курсор; для испорченного возвращает None."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        return json.loads(raw.decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+
+
+class CursorPage(Sequence):
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self)} objects>"
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Постраничный вывод по курсору, без OFFSET и COUNT."""
+    cursor_based = True
+
+    def __init__(self, object_list, per_page, order_field="pub_date",
+                 tie_field="pk"):
+        self.order_field = order_field
+        self.tie_field = tie_field
+        self.object_list = object_list.order_by(
+            f"-{order_field}", f"-{tie_field}"
+        )
+        self.per_page = int(per_page)
+
+    def encode_cursor(self, direction, obj):
+        value = getattr(obj, self.order_field).isoformat()
+        tie = getattr(obj, self.tie_field)
+        return encode_token([direction, value, tie])
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, value, tie = decode_token(cursor)
+            value, tie = parse_datetime(value), int(tie)
+        except (ValueError, TypeError):
+            return None
+        if direction not in ("n", "p") or value is None:
+            return None
+        return direction, value, tie
+
+    def get_page(self, cursor=None):
+        position = self.decode_cursor(cursor) if cursor else None
+        if position is None:
+            items = list(self.object_list[:self.per_page + 1])
+            has_more, items = len(items) > self.per_page, items[:self.per_page]
+            return self._page(items, has_next=has_more, has_previous=False)
+
+        direction, value, tie = position
+        field, tie_field = self.order_field, self.tie_field
+        if direction == "n":
+            after = Q(**{f"{field}__lt": value}) | Q(
+                **{field: value, f"{tie_field}__lt": tie}
+            )
+            items = list(self.object_list.filter(after)[:self.per_page + 1])
+            has_more, items = len(items) > self.per_page, items[:self.per_page]
+            return self._page(items, has_next=has_more, has_previous=True)
+
+        before = Q(**{f"{field}__gt": value}) | Q(
+            **{field: value, f"{tie_field}__gt": tie}
+        )
+        items = list(
+            self.object_list.filter(before).order_by(field, tie_field)
+            [:self.per_page + 1]
+        )
+        has_more, items = len(items) > self.per_page, items[:self.per_page]
+        items.reverse()
+        return self._page(items, has_next=True, has_previous=has_more)
+
+    def _page(self, items, has_next, has_previous):
+        next_cursor = previous_cursor = None
+        if items and has_next:
+            next_cursor = self.encode_cursor("n", items[-1])
+        if items and has_previous:
+            previous_cursor = self.encode_cursor("p", items[0])
+        return CursorPage(items, next_cursor, previous_cursor)
+
+
+def paginate(request, object_list, per_page, order_field="pub_date",
+             tie_field="pk"):
+    """Страница и пагинатор ленты: курсорный или обычный по ``?page=``."""
+    if settings.FEED_CURSOR_PAGINATION or "cursor" in request.GET:
+        paginator = CursorPaginator(
+            object_list, per_page, order_field, tie_field
+        )
+        return paginator.get_page(request.GET.get("cursor")), paginator
+    paginator = Paginator(object_list, per_page)
+    return paginator.get_page(request.GET.get("page")), paginator
@@ -0,0 +1,212 @@
+"""Рекомендации «на кого подписаться», рассчитанные заранее."""
+import heapq
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from . import counters, follow_graph, freshness
+from .models import Follow, Post, Recommendation, UserStats
+
+User = get_user_model()
+
+
+class GroupProfile:
+    """Доли постов авторов по сообществам и лучшие авторы сообществ."""
+
+    def __init__(self):
+        self.author_groups = defaultdict(dict)
+        self.group_authors = defaultdict(list)
+
+    @classmethod
+    def load(cls):
+        profile = cls()
+        rows = (
+            Post.objects.filter(group__isnull=False).order_by()
+            .values_list("author_id", "group_id")
+            .annotate(count=Count("id"))
+        )
+        totals = Counter()
+        counts = []
+        for author_id, group_id, count in rows.iterator():
+            totals[author_id] += count
+            counts.append((author_id, group_id, count))
+        for author_id, group_id, count in counts:
+            profile.author_groups[author_id][group_id] = (
+                count / totals[author_id]
+            )
+            profile.group_authors[group_id].append((count, author_id))
+        limit = settings.RECOMMENDATIONS_GROUP_CANDIDATES
+        for group_id, authors in profile.group_authors.items():
+            profile.group_authors[group_id] = [
+                author_id for _, author_id in heapq.nlargest(limit, authors)
+            ]
+        return profile
+
+    def interests(self, user_id, following):
+        """Нормированный вектор сообществ пользователя."""
+        vector = Counter(self.author_groups.get(user_id, {}))
+        for author_id in following:
+            vector.update(self.author_groups.get(author_id, {}))
+        total = sum(vector.values())
+        return {
+            group_id: weight / total for group_id, weight in vector.items()
+        } if total else {}
+
+    def affinity(self, interests, author_id):
+        shares = self.author_groups.get(author_id, {})
+        return sum(
+            weight * shares.get(group_id, 0.0)
+            for group_id, weight in interests.items()
+        )
+
+
+def co_follow_scores(graph, user_id, following):
+    """Сколько раз авторы встречаются у «соседей» пользователя."""
+    scores = Counter()
+    limit = settings.RECOMMENDATIONS_MAX_FOLLOWERS
+    for author_id in following:
+        followers = graph.followers(author_id)
+        # Подписчики популярных авторов мало говорят о вкусах.
+        if len(followers) > limit:
+            continue
+        for neighbour_id in followers:
+            if neighbour_id != user_id:
+                scores.update(graph.following(neighbour_id))
+    return scores
+
+
+def recommend(graph, groups, user_id):
+    """Лучшие авторы для пользователя: список пар (автор, оценка)."""
+    following = graph.following(user_id)
+    scores = co_follow_scores(graph, user_id, following)
+    interests = groups.interests(user_id, following)
+    candidates = set(scores)
+    for group_id in interests:
+        candidates.update(groups.group_authors.get(group_id, ()))
+    candidates.discard(user_id)
+    candidates.difference_update(following)
+
+    weight = settings.RECOMMENDATIONS_GROUP_WEIGHT
+    ranked = (
+        (scores[author_id] + weight * groups.affinity(interests, author_id),
+         author_id)
+        for author_id in candidates
+    )
+    best = heapq.nlargest(settings.RECOMMENDATIONS_COUNT, ranked)
+    return [(author_id, score) for score, author_id in best if score > 0]
+
+
+def stale_users():
+    """Пользователи, чьи подписки менялись после последнего расчёта."""
+    return User.objects.exclude(
+        stats__recommendations_stale=0
+    ).values_list("pk", flat=True)
+
+
+def load_graph(user_ids):
+    """Часть графа, которую обходит расчёт для ``user_ids``."""
+    authors = Follow.objects.filter(user__in=user_ids).values("author")
+    popular = (
+        Follow.objects.filter(author__in=authors).order_by()
+        .values("author").annotate(total=Count("id"))
+        .filter(total__gt=settings.RECOMMENDATIONS_MAX_FOLLOWERS)
+        .values("author")
+    )
+    neighbours = Follow.objects.filter(author__in=authors).exclude(
+        author__in=popular
+    ).values("user")
+    return follow_graph.FollowGraph.load(follows=Follow.objects.filter(
+        Q(user__in=user_ids) | Q(author__in=authors)
+        | Q(user__in=neighbours)
+    ))
+
+
+def read_marks(user_ids):
+    """Метки устаревания пользователей; недостающие строки создаются."""
+    marks = dict(
+        UserStats.objects.filter(user_id__in=user_ids)
+        .values_list("user_id", "recommendations_stale")
+    )
+    missing = set(user_ids).difference(marks)
+    if missing:
+        counters.reconcile_users(list(missing))
+        marks.update(
+            UserStats.objects.filter(user_id__in=missing)
+            .values_list("user_id", "recommendations_stale")
+        )
+    return marks
+
+
+def _batches(user_ids, batch_size, whole_graph):
+    """Пачки пользователей с их метками и графом для расчёта."""
+    # Метки читаются раньше графа, чтобы не потерять новую подписку.
+    batches = [
+        user_ids[start:start + batch_size]
+        for start in range(0, len(user_ids), batch_size)
+    ]
+    if whole_graph:
+        marks = [read_marks(batch) for batch in batches]
+        graph = follow_graph.FollowGraph.load()
+        for batch, batch_marks in zip(batches, marks):
+            yield batch, batch_marks, graph
+        return
+    for batch in batches:
+        batch_marks = read_marks(batch)
+        yield batch, batch_marks, load_graph(batch)
+
+
+def clear_marks(marks):
+    """Сбрасывает метки, которые не менялись с чтения ``marks``."""
+    by_mark = defaultdict(list)
+    for user_id, mark in marks.items():
+        if mark:
+            by_mark[mark].append(user_id)
+    for mark, user_ids in by_mark.items():
+        UserStats.objects.filter(
+            user_id__in=user_ids, recommendations_stale=mark
+        ).update(recommendations_stale=0)
+
+
+def build(user_ids, batch_size=500, whole_graph=False):
+    """Пересчитывает рекомендации ``user_ids``; возвращает их число."""
+    user_ids = list(user_ids)
+    groups = GroupProfile.load()
+    for batch, marks, graph in _batches(user_ids, batch_size, whole_graph):
+        rows = [
+            Recommendation(user_id=user_id, author_id=author_id, score=score)
+            for user_id in batch
+            for author_id, score in recommend(graph, groups, user_id)
+        ]
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=batch).delete()
+            Recommendation.objects.bulk_create(rows)
+            clear_marks(marks)
+            freshness.touch(
+                f"recommendations:{user_id}" for user_id in batch
+            )
+    return len(user_ids)
+
+
+def mark_stale(*user_ids):
+    UserStats.objects.filter(user_id__in=user_ids).update(
+        recommendations_stale=F("recommendations_stale") + 1
+    )
+
+
+def for_user(user, limit=None):
+    """Сохранённые рекомендации без авторов, на которых уже подписан."""
+    limit = limit or settings.RECOMMENDATIONS_SHOWN
+    graph = follow_graph.get_graph()
+    recommended = (
+        Recommendation.objects.filter(user=user)
+        .select_related("author").order_by("-score", "-author_id")
+    )
+    # Подписки после расчёта отсеиваются здесь, поэтому строк с запасом.
+    authors = [
+        row.author for row in recommended[:settings.RECOMMENDATIONS_COUNT]
+        if not graph.is_following(user.pk, row.author_id)
+    ]
+    return authors[:limit]
@@ -0,0 +1,136 @@
+"""Полнотекстовый поиск по постам в таблице FTS5 ``posts_search``."""
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Group, Post
+from .paginator import CursorPage, decode_token, encode_token
+
+User = get_user_model()
+
+TABLE = "posts_search"
+
+
+def _select_documents(where):
+    return (
+        f"SELECT p.id, p.text, COALESCE(g.title, ''), u.username "
+        f"FROM {Post._meta.db_table} p "
+        f"JOIN {User._meta.db_table} u ON u.id = p.author_id "
+        f"LEFT JOIN {Group._meta.db_table} g ON g.id = p.group_id "
+        f"WHERE {where}"
+    )
+
+
+def reindex(post_ids):
+    """Переписывает документы постов ``post_ids`` по данным из базы."""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {TABLE} WHERE rowid IN ({placeholders})", post_ids
+        )
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, text, group_title, author) "
+            + _select_documents(f"p.id IN ({placeholders})"),
+            post_ids,
+        )
+
+
+def remove(post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [post_id])
+
+
+def rebuild():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, text, group_title, author) "
+            + _select_documents("1")
+        )
+
+
+def match_expression(query):
+    """Запрос FTS5: слова ввода в кавычках, по префиксу, через AND."""
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class MatchingIds(RawSQL):
+    """Подзапрос id для ``pk__in`` без лишних скобок ``RawSQL``."""
+
+    def as_sql(self, compiler, connection):
+        # Со второй парой скобок SQLite вернул бы одну строку.
+        return self.sql, self.params
+
+
+def matching(queryset, query):
+    """Сужает ``queryset`` до постов, подходящих под запрос."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.filter(pk__in=MatchingIds(
+        f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [expression]
+    ))
+
+
+class SearchPaginator:
+    """Курсорный вывод результатов поиска в порядке bm25."""
+    cursor_based = True
+
+    def __init__(self, query, per_page):
+        self.expression = match_expression(query)
+        self.per_page = int(per_page)
+
+    def _ranked(self, after, direction, limit):
+        weights = ", ".join(str(weight) for weight in settings.SEARCH_WEIGHTS)
+        sql = (
+            f"SELECT id, score FROM (SELECT rowid AS id, "
+            f"bm25({TABLE}, {weights}) AS score FROM {TABLE} "
+            f"WHERE {TABLE} MATCH %s)"
+        )
+        params = [self.expression]
+        if after is not None:
+            sign = ">" if direction == "n" else "<"
+            sql += f" WHERE score {sign} %s OR (score = %s AND id {sign} %s)"
+            params += [after[0], after[0], after[1]]
+        order = "" if direction == "n" else " DESC"
+        sql += f" ORDER BY score{order}, id{order} LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def get_page(self, cursor=None):
+        if not self.expression:
+            return CursorPage([], None, None)
+        position = decode_token(cursor) if cursor else None
+        try:
+            direction, score, tie = position
+            after = float(score), int(tie)
+        except (TypeError, ValueError):
+            direction, after = "n", None
+        if direction not in ("n", "p"):
+            direction, after = "n", None
+
+        rows = self._ranked(after, direction, self.per_page + 1)
+        has_more, rows = len(rows) > self.per_page, rows[:self.per_page]
+        if direction == "p":
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, after is not None
+
+        posts = Post.objects.for_feed().in_bulk([pk for pk, _ in rows])
+        items = [posts[pk] for pk, _ in rows if pk in posts]
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_token(["n", rows[-1][1], rows[-1][0]])
+        if rows and has_previous:
+            previous_cursor = encode_token(["p", rows[0][1], rows[0][0]])
+        return CursorPage(items, next_cursor, previous_cursor)
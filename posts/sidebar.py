@@ -0,0 +1,61 @@
+"""Боковая колонка главной: сообщества и авторы по последней активности."""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+
+from yatube.routers import primary
+from .models import Group
+from .page_cache import LOCK_TIMEOUT, bump_generation, get_generation
+
+User = get_user_model()
+
+CACHE_KEY = "index_sidebar"
+
+
+@primary()
+def build():
+    limit = settings.SIDEBAR_LIMIT
+    groups = Group.objects.annotate(
+        last_post=Max("posts__pub_date")
+    ).order_by(F("last_post").desc(nulls_last=True), "title")
+    authors = User.objects.filter(posts__isnull=False).annotate(
+        last_post=Max("posts__pub_date")
+    ).order_by("-last_post")
+    return {
+        "groups": list(groups.values("slug", "title")[:limit]),
+        "authors": list(authors.values("username")[:limit]),
+    }
+
+
+def get_sidebar():
+    generation = get_generation(CACHE_KEY)
+    entry = cache.get(CACHE_KEY)
+    if entry is not None and entry["generation"] == generation:
+        return entry["sidebar"]
+    lock = f"{CACHE_KEY}:lock"
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        if entry is not None:
+            return entry["sidebar"]
+        return build()
+    try:
+        return refresh(generation)
+    finally:
+        cache.delete(lock)
+
+
+def refresh(generation=None):
+    if generation is None:
+        generation = get_generation(CACHE_KEY)
+    sidebar = build()
+    cache.set(
+        CACHE_KEY, {"generation": generation, "sidebar": sidebar},
+        settings.SIDEBAR_CACHE_TIMEOUT
+    )
+    return sidebar
+
+
+def invalidate():
+    bump_generation(CACHE_KEY)
+    transaction.on_commit(lambda: bump_generation(CACHE_KEY))
@@ -0,0 +1,172 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import (
+    counters, feeds, follow_graph, freshness, recommendations, search,
+    sidebar, thumbnail_gc, timeline
+)
+from .models import Comment, Follow, Group, Post
+from .page_cache import invalidate
+
+User = get_user_model()
+
+
+def release_image(name):
+    if name:
+        transaction.on_commit(lambda: thumbnail_gc.release(name))
+
+
+def touch_post_pages(post_id):
+    """Сбрасывает метки страниц поста, но не его RSS и Atom."""
+    rows = Post.objects.filter(pk=post_id).values_list(
+        "pk", "author_id", "group_id"
+    )
+    freshness.touch(freshness.post_scopes(*rows))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, update_fields=None, **kwargs):
+    instance._previous_image = None
+    instance._previous_group_id = None
+    if instance.pk and (
+        update_fields is None
+        or {"image", "group"}.intersection(update_fields)
+    ):
+        instance._previous_image, instance._previous_group_id = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list("image", "group_id").first() or (None, None)
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if instance._previous_image != instance.image.name:
+        release_image(instance._previous_image)
+    search.reindex([instance.pk])
+    freshness.touch(freshness.post_scopes(
+        (instance.pk, instance.author_id, instance.group_id),
+        (instance.pk, instance.author_id, instance._previous_group_id),
+    ))
+    if created:
+        counters.change_user(instance.author_id, "posts_count", 1)
+        timeline.fan_out(instance)
+        feeds.note_post(instance)
+    else:
+        Post.objects.filter(pk=instance.pk).bump_version()
+        feeds.invalidate(feeds.feed_scopes(instance))
+        if instance._previous_group_id not in (None, instance.group_id):
+            feeds.invalidate([f"group:{instance._previous_group_id}"])
+    sidebar.invalidate()
+    invalidate("index_page")
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, "posts_count", -1)
+    search.remove(instance.pk)
+    freshness.touch(freshness.post_scopes(
+        (instance.pk, instance.author_id, instance.group_id)
+    ))
+    release_image(instance.image.name)
+    sidebar.invalidate()
+    feeds.invalidate(feeds.feed_scopes(instance))
+    invalidate("index_page")
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post(instance.post_id, 1)
+        Post.objects.filter(pk=instance.post_id).bump_version()
+        touch_post_pages(instance.post_id)
+        invalidate("index_page")
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+    Post.objects.filter(pk=instance.post_id).bump_version()
+    touch_post_pages(instance.post_id)
+    invalidate("index_page")
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    instance.posts.bump_version()
+    freshness.touch(["all"])
+    feeds.invalidate_all()
+    sidebar.invalidate()
+    invalidate("index_page")
+    # При удалении посты отвяжутся от сообщества уже после сигнала,
+    # поэтому их список запоминается до удаления.
+    instance._post_ids = list(instance.posts.values_list("pk", flat=True))
+    if kwargs.get("created") is False:
+        search.reindex(instance._post_ids)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    search.reindex(instance._post_ids)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    instance._previous_username = None
+    if instance.pk and (
+        update_fields is None or "username" in update_fields
+    ):
+        instance._previous_username = (
+            User.objects.filter(pk=instance.pk)
+            .values_list("username", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # Смена пароля, вход и правки в админке имя не меняют, а сброс
+    # всех лент и переиндексация постов автора дороги.
+    previous = getattr(instance, "_previous_username", None)
+    if created or previous in (None, instance.username):
+        return
+    instance.posts.bump_version()
+    search.reindex(instance.posts.values_list("pk", flat=True))
+    freshness.touch(["all"])
+    feeds.invalidate_all()
+    sidebar.invalidate()
+    invalidate("index_page")
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, "followers_count", 1)
+        counters.change_user(instance.user_id, "followings_count", 1)
+        timeline.update_modes([instance.author_id])
+        timeline.backfill(instance.user_id, instance.author_id)
+        follow_graph.record(
+            follow_graph.ADD, instance.user_id, instance.author_id
+        )
+        recommendations.mark_stale(instance.user_id)
+        freshness.touch([
+            f"follow:{instance.user_id}", f"author:{instance.author_id}"
+        ])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, "followers_count", -1)
+    counters.change_user(instance.user_id, "followings_count", -1)
+    timeline.retract(instance.user_id, instance.author_id)
+    timeline.update_modes([instance.author_id])
+    follow_graph.record(
+        follow_graph.REMOVE, instance.user_id, instance.author_id
+    )
+    recommendations.mark_stale(instance.user_id)
+    freshness.touch([
+        f"follow:{instance.user_id}", f"author:{instance.author_id}"
+    ])
@@ -0,0 +1,93 @@
+"""Хранилище картинок постов с именами по SHA-256 содержимого."""
+import hashlib
+import posixpath
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+LOCK_TIMEOUT = 30
+# Закрепление, не снятое из-за отката транзакции, истекает само.
+PIN_TIMEOUT = 60 * 5
+
+
+@contextmanager
+def image_lock(name):
+    """Исключительная блокировка имени файла между процессами."""
+    key = f"image_lock:{name}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(key, token, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Не удалось заблокировать {name}")
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        # Истёкшую блокировку мог взять другой процесс: её не снимаем.
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def pin_key(name):
+    return f"image_pins:{name}"
+
+
+def pin(name):
+    """Закрепляет файл до фиксации текущей транзакции."""
+    if not cache.add(pin_key(name), 1, PIN_TIMEOUT):
+        try:
+            cache.incr(pin_key(name))
+        except ValueError:
+            cache.add(pin_key(name), 1, PIN_TIMEOUT)
+    transaction.on_commit(lambda: _unpin(name))
+
+
+def _unpin(name):
+    try:
+        if cache.decr(pin_key(name)) <= 0:
+            cache.delete(pin_key(name))
+    except ValueError:
+        pass
+
+
+def is_pinned(name):
+    return bool(cache.get(pin_key(name)))
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        value = digest.hexdigest()
+        return posixpath.join(directory, value[:2], value + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        with image_lock(name):
+            pin(name)
+            if self.exists(name):
+                return name
+            saved = self._save(name, content)
+        if saved != name:
+            # Тот же файл одновременно сохранил другой процесс.
+            self.delete(saved)
+        return name
+
+
+post_images = ContentHashStorage()
@@ -0,0 +1,27 @@
+from django import template
+from django.conf import settings
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag("includes/post_image.html")
+def post_image(post, size="card"):
+    """Картинка поста с вариантами для srcset или заглушка."""
+    context = {"image": post.image, "sizes": settings.IMAGE_VARIANT_SIZES}
+    variants = post.variants if post.image else {}
+    if variants:
+        fallback = variants["jpeg"][-1]
+        context.update(
+            webp_srcset=thumbnails.srcset(variants.get("webp", [])),
+            jpeg_srcset=thumbnails.srcset(variants["jpeg"]),
+            fallback=fallback,
+            fallback_url=thumbnails.url(fallback["name"]),
+        )
+    else:
+        context.update(
+            thumbnail=thumbnails.lookup(post.image, size),
+            placeholder=thumbnails.placeholder(size),
+        )
+    return context
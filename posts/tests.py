@@ -1,11 +1,28 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client, override_settings
+from django.core.management import CommandError, call_command
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from io import BytesIO
+from io import BytesIO, StringIO
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
 from PIL import Image
-from .models import Post, Group, Follow, Comment
+from . import (
+    archive, feeds, follow_graph, freshness, page_cache, recommendations,
+    search, sidebar, storage, thumbnail_gc, thumbnails, timeline, views
+)
+from .models import (
+    Post, Group, Follow, Comment, Recommendation, TimelineEntry, UserStats
+)
+from .paginator import CursorPaginator
 
 User = get_user_model()
 
@@ -16,6 +33,42 @@ CACHE_DEFAULT = {
     }
 
 
+class BaseTest(TestCase):
+    """Читатель, автор и сообщество; кеш пуст в начале каждого теста."""
+    # В TestCase транзакция не фиксируется: с этим флагом отложенные
+    # действия выполняются сразу.
+    run_on_commit = False
+
+    def setUp(self):
+        cache.clear()
+        if self.run_on_commit:
+            patcher = mock.patch.object(
+                transaction, "on_commit", lambda f: f()
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.reader = User.objects.create_user(username="reader")
+        self.author = User.objects.create_user(username="gogol")
+        self.group = Group.objects.create(
+            title="Повести", slug="stories", description="Петербургские"
+        )
+        self.client_reader = self.login(self.reader)
+
+    def login(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def add_posts(self, count, **fields):
+        fields.setdefault("group", self.group)
+        return [
+            Post.objects.create(
+                text=f"повесть {number}", author=self.author, **fields
+            )
+            for number in range(count)
+        ]
+
+
 class PostTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -199,7 +252,8 @@ class PostTest(TestCase):
         self.assertNotContains(response, '<img class')
 
     def test_cache_index(self):
-        """Проверка, что главная странийа кэшируется."""
+        """Проверка, что главная страница кэшируется
+           и сбрасывается при появлении нового поста."""
         cache.clear()
         post = Post.objects.create(
             text="проверка кэша",
@@ -208,15 +262,15 @@ class PostTest(TestCase):
         )
         response = self.client_auth.get(reverse('index'))
         self.assertContains(response, post.text)
+        Post.objects.filter(pk=post.pk).update(text="без сигнала")
+        response = self.client_auth.get(reverse('index'))
+        self.assertContains(response, post.text)
         post2 = Post.objects.create(
             text="дубль два",
             author=self.user,
             group=self.group
         )
         response2 = self.client_auth.get(reverse('index'))
-        self.assertNotContains(response2, post2.text)
-        cache.clear()
-        response2 = self.client_auth.get(reverse('index'))
         self.assertContains(response2, post2.text)
 
     def test_auth_follow(self):
@@ -333,3 +387,1539 @@ class PostTest(TestCase):
             reverse('post', kwargs={'username': 'james', 'post_id': post.id})
         )
         self.assertNotContains(resp, "comm_unath")
+
+
+class TimelineTest(BaseTest):
+    def feed_texts(self):
+        response = self.client_reader.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_fan_out_on_post(self):
+        """Новый пост раскладывается в ленты подписчиков"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text="в ленту", author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.feed_texts(), ["в ленту"])
+
+    def test_backfill_and_retract(self):
+        """Подписка дополняет ленту, отписка очищает её"""
+        Post.objects.create(text="старый пост", author=self.author)
+        self.client_reader.get(
+            reverse('profile_follow', kwargs={'username': 'gogol'})
+        )
+        self.assertEqual(self.feed_texts(), ["старый пост"])
+        self.client_reader.get(
+            reverse('profile_unfollow', kwargs={'username': 'gogol'})
+        )
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+        self.assertEqual(self.feed_texts(), [])
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=0)
+    def test_pull_author(self):
+        """Посты популярных авторов читаются без раскладки"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text="популярный пост", author=self.author)
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+        self.assertEqual(self.feed_texts(), ["популярный пост"])
+
+    def test_rebuild_command(self):
+        """Команда rebuild_timelines восстанавливает ленты"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text="первый", author=self.author)
+        Post.objects.create(text="второй", author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+        self.assertEqual(self.feed_texts(), ["второй", "первый"])
+
+    def test_rebuild_command_clears_unfollowed(self):
+        """Команда очищает ленты пользователей без подписок"""
+        post = Post.objects.create(text="старый", author=self.author)
+        TimelineEntry.objects.create(
+            user=self.reader, post=post, pub_date=post.pub_date
+        )
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=1)
+    def test_back_to_push(self):
+        """После возврата в режим push посты автора раскладываются"""
+        other = User.objects.create_user(username="other")
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        Post.objects.create(text="пока популярен", author=self.author)
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+        Follow.objects.filter(user=other).delete()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 1
+        )
+        self.assertEqual(self.feed_texts(), ["пока популярен"])
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=2)
+    def test_back_to_push_after_drift(self):
+        """Возврат в push не зависит от точного значения счётчика"""
+        for name in ("first", "second"):
+            Follow.objects.create(
+                user=User.objects.create_user(username=name),
+                author=self.author
+            )
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text="пока популярен", author=self.author)
+        UserStats.objects.filter(user=self.author).update(followers_count=2)
+        Follow.objects.filter(user__username="first").delete()
+        self.assertEqual(self.feed_texts(), ["пока популярен"])
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 1
+        )
+
+    @override_settings(TIMELINE_BATCH_SIZE=2)
+    def test_backfill_all_posts(self):
+        """Подписка добавляет в ленту все посты автора"""
+        self.add_posts(5)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 5
+        )
+
+
+class CursorPaginationTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.add_posts(25)
+        self.url = reverse('group', kwargs={'slug': 'stories'})
+
+    def texts(self, response):
+        return [post.text for post in response.context['page']]
+
+    def test_walk_forward_and_back(self):
+        """Курсоры ведут вперёд и назад по ленте без пропусков"""
+        first = self.client.get(self.url, {'cursor': ''})
+        self.assertEqual(self.texts(first)[0], "повесть 24")
+        self.assertFalse(first.context['page'].has_previous())
+        second = self.client.get(
+            self.url, {'cursor': first.context['page'].next_cursor}
+        )
+        third = self.client.get(
+            self.url, {'cursor': second.context['page'].next_cursor}
+        )
+        self.assertEqual(
+            self.texts(third), [f"повесть {n}" for n in range(4, -1, -1)]
+        )
+        self.assertFalse(third.context['page'].has_next())
+        back = self.client.get(
+            self.url, {'cursor': third.context['page'].previous_cursor}
+        )
+        self.assertEqual(self.texts(back), self.texts(second))
+        self.assertContains(back, '?cursor=')
+
+    def test_no_count_query(self):
+        """Курсорная страница не выполняет COUNT"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'cursor': ''})
+        self.assertFalse(
+            any('COUNT(*)' in query['sql'] for query in queries)
+        )
+
+    def test_bad_cursor(self):
+        """Испорченный курсор открывает первую страницу"""
+        response = self.client.get(self.url, {'cursor': 'не-курсор'})
+        self.assertEqual(self.texts(response)[0], "повесть 24")
+
+    @override_settings(FEED_CURSOR_PAGINATION=True)
+    def test_enabled_by_setting(self):
+        """Настройка включает курсорную пагинацию для всех лент"""
+        response = self.client.get(self.url)
+        self.assertIsInstance(response.context['paginator'], CursorPaginator)
+
+
+@override_settings(CACHES=CACHE_DEFAULT)
+class FeedQueriesTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def add_posts(self, count):
+        for post in super().add_posts(count):
+            Comment.objects.create(post=post, author=self.reader, text="!")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_reader.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        """Число запросов ленты не зависит от числа постов на странице"""
+        self.add_posts(1)
+        single = self.count_queries(url)
+        self.add_posts(9)
+        self.assertEqual(
+            self.count_queries(url), single,
+            f"Число запросов к {url} растёт вместе с числом постов"
+        )
+
+    def test_index(self):
+        self.assertConstantQueries(reverse('index'))
+
+    def test_group(self):
+        self.assertConstantQueries(
+            reverse('group', kwargs={'slug': 'stories'})
+        )
+
+    def test_profile(self):
+        self.assertConstantQueries(
+            reverse('profile', kwargs={'username': 'gogol'})
+        )
+
+    def test_follow_index(self):
+        self.assertConstantQueries(reverse('follow_index'))
+
+    def test_comment_count(self):
+        """Количество комментариев выводится из счётчика поста"""
+        self.add_posts(1)
+        response = self.client_reader.get(reverse('index'))
+        self.assertEqual(response.context['page'][0].comments_count, 1)
+        self.assertContains(response, "комментариев: 1")
+
+
+class SidebarTest(BaseTest):
+    def test_only_active_authors(self):
+        """В колонке только авторы, у которых есть посты"""
+        Post.objects.create(text="стих", author=self.author, group=self.group)
+        authors = [a["username"] for a in sidebar.get_sidebar()["authors"]]
+        self.assertEqual(authors, ["gogol"])
+
+    def test_updated_by_signals(self):
+        """Новый пост поднимает автора наверх, удаление убирает его"""
+        Post.objects.create(text="первый", author=self.author)
+        sidebar.get_sidebar()
+        post = Post.objects.create(text="второй", author=self.reader)
+        authors = [a["username"] for a in sidebar.get_sidebar()["authors"]]
+        self.assertEqual(authors, ["reader", "gogol"])
+        post.delete()
+        authors = [a["username"] for a in sidebar.get_sidebar()["authors"]]
+        self.assertEqual(authors, ["gogol"])
+
+    def test_single_rebuild(self):
+        """Пока колонку пересобирает другой процесс, отдаётся прежняя"""
+        Post.objects.create(text="первый", author=self.author)
+        sidebar.get_sidebar()
+        Post.objects.create(text="второй", author=self.reader)
+        lock = f"{sidebar.CACHE_KEY}:lock"
+        cache.add(lock, 1)
+        with self.assertNumQueries(0):
+            stale = sidebar.get_sidebar()
+        self.assertEqual(stale["authors"], [{"username": "gogol"}])
+        cache.delete(lock)
+        authors = [a["username"] for a in sidebar.get_sidebar()["authors"]]
+        self.assertEqual(authors, ["reader", "gogol"])
+
+    @override_settings(SIDEBAR_LIMIT=1)
+    def test_bounded(self):
+        """Размер колонки ограничен настройкой SIDEBAR_LIMIT"""
+        Group.objects.create(title="проза", slug="prose")
+        Post.objects.create(text="первый", author=self.author)
+        sidebar.get_sidebar()
+        Post.objects.create(text="второй", author=self.reader)
+        current = sidebar.get_sidebar()
+        self.assertEqual(current["authors"], [{"username": "reader"}])
+        self.assertEqual(len(current["groups"]), 1)
+
+    def test_index_queries(self):
+        """Закешированная колонка не запрашивается при показе главной"""
+        for number in range(5):
+            user = User.objects.create_user(username=f"author{number}")
+            Post.objects.create(text="пост", author=user)
+        sidebar.get_sidebar()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertFalse(
+            any('auth_user' in query['sql'] and 'posts_post' not in
+                query['sql'] for query in queries)
+        )
+
+
+class CountersTest(BaseTest):
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_maintained_on_create_and_delete(self):
+        """Счётчики меняются при создании и удалении объектов"""
+        post = Post.objects.create(text="шинель", author=self.author)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text="!"
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).followings_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).followings_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_reconcile_command(self):
+        """Команда reconcile_counters исправляет расхождения"""
+        post = Post.objects.create(text="нос", author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text="!")
+        UserStats.objects.update(posts_count=42)
+        Post.objects.update(comments_count=0)
+        call_command(
+            'reconcile_counters', '--batch-size', '1', stdout=StringIO()
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+
+    def test_profile_card(self):
+        """Карточка профиля берёт числа из счётчиков"""
+        self.add_posts(3)
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(
+            reverse('profile', kwargs={'username': 'gogol'})
+        )
+        self.assertContains(response, "Записей: 3")
+        self.assertContains(response, "Подписчиков: 1")
+
+
+class PostCardCacheTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.client_author = self.login(self.author)
+        self.post = Post.objects.create(
+            text="тёмные аллеи", author=self.author, group=self.group
+        )
+        self.url = reverse('group', kwargs={'slug': 'stories'})
+
+    def test_edit_bumps_version(self):
+        """Редактирование поста обновляет закешированную карточку"""
+        self.client_reader.get(self.url)
+        self.client_author.post(
+            reverse('edit_post', kwargs={
+                'username': 'gogol', 'post_id': self.post.id
+            }),
+            {"text": "антоновские яблоки", "group": self.group.id}
+        )
+        response = self.client_reader.get(self.url)
+        self.assertContains(response, "антоновские яблоки")
+
+    def test_comment_bumps_version(self):
+        """Новый комментарий обновляет счётчик в карточке"""
+        self.client_reader.get(self.url)
+        Comment.objects.create(post=self.post, author=self.reader, text="!")
+        response = self.client_reader.get(self.url)
+        self.assertContains(response, "комментариев: 1")
+
+    def test_rename_bumps_version(self):
+        """Переименование автора обновляет ссылки в карточках"""
+        self.client_reader.get(self.url)
+        self.author.username = "ivan"
+        self.author.save()
+        response = self.client_reader.get(self.url)
+        self.assertContains(response, "/ivan/")
+        self.assertNotContains(response, "/gogol/")
+
+    def test_save_without_rename(self):
+        """Сохранение без смены имени не трогает посты"""
+        version = self.post.version
+        freshness.stamps(["all"])
+        self.author.set_password("секрет")
+        self.author.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, version)
+        self.assertIsNotNone(cache.get(freshness.stamp_key("all")))
+
+    def test_group_change_bumps_version(self):
+        """Переименование сообщества обновляет карточки его постов"""
+        self.client_reader.get(self.url)
+        self.group.title = "малая проза"
+        self.group.save()
+        response = self.client_reader.get(self.url)
+        self.assertContains(response, "#малая проза")
+
+    def test_edit_link_outside_cache(self):
+        """Ссылка «Редактировать» видна только автору общей карточки"""
+        response = self.client_reader.get(self.url)
+        self.assertNotContains(response, "Редактировать")
+        response = self.client_author.get(self.url)
+        self.assertContains(response, "Редактировать")
+        response = self.client_reader.get(self.url)
+        self.assertNotContains(response, "Редактировать")
+
+
+class IndexPageCacheTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(text="ночь, улица", author=self.author)
+
+    def silently_edit(self, text):
+        posts = Post.objects.filter(pk=self.post.pk)
+        posts.update(text=text)
+        posts.bump_version()
+
+    def test_stale_served_while_rebuilding(self):
+        """Пока страницу пересобирает другой процесс, отдаётся прошлая"""
+        self.client.get(reverse('index'))
+        self.silently_edit("фонарь, аптека")
+        page_cache.bump_generation('index_page')
+        request = RequestFactory().get(reverse('index'))
+        request.user = AnonymousUser()
+        key = page_cache.page_key('index_page', request)
+        cache.add(f"{key}:lock", 1)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, "ночь, улица")
+        cache.delete(f"{key}:lock")
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, "фонарь, аптека")
+
+    def test_variants_cached_separately(self):
+        """Анонимный и авторизованный варианты кешируются раздельно"""
+        self.client.get(reverse('index'))
+        response = self.client_reader.get(reverse('index'))
+        self.assertContains(response, "Пользователь: reader")
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, "Пользователь: reader")
+
+
+@override_settings(FEED_CURSOR_PAGINATION=False)
+class QueryPlanTest(BaseTest):
+    """Запросы страниц не сканируют таблицы целиком и не сортируют
+       результат во временном B-дереве."""
+
+    def setUp(self):
+        super().setUp()
+        Follow.objects.create(user=self.reader, author=self.author)
+        for post in self.add_posts(11):
+            Comment.objects.create(post=post, author=self.reader, text="!")
+        self.post = post
+        # Боковая колонка собирается заранее и не входит в путь запроса.
+        sidebar.refresh()
+
+    def assertIndexedPlans(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_reader.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        cursor = connection.cursor()
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'posts_' not in sql:
+                continue
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            for row in cursor.fetchall():
+                detail = row[-1]
+                self.assertNotIn("TEMP B-TREE", detail, f"{url}: {sql}")
+                # SCAN подзапроса обходит уже отобранные строки, а не таблицу.
+                if detail.startswith("SCAN") and "subquery" not in detail:
+                    self.assertIn("INDEX", detail, f"{url}: {sql}")
+        return response
+
+    def test_feeds(self):
+        urls = (
+            reverse('index'),
+            reverse('group', kwargs={'slug': 'stories'}),
+            reverse('profile', kwargs={'username': 'gogol'}),
+            reverse('follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url)
+                response = self.assertIndexedPlans(url, {'cursor': ''})
+                self.assertIndexedPlans(
+                    url, {'cursor': response.context['page'].next_cursor}
+                )
+
+    def test_post_view(self):
+        self.assertIndexedPlans(reverse('post', kwargs={
+            'username': 'gogol', 'post_id': self.post.id
+        }))
+
+
+def use_temporary_media(test):
+    """Сохраняет файлы теста во временный MEDIA_ROOT."""
+    media = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media)
+    override = override_settings(MEDIA_ROOT=media)
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+def make_image(name="test.png", size=(100, 100), color=(155, 0, 0)):
+    file = BytesIO()
+    Image.new('RGB', size=size, color=color).save(file, 'png')
+    return SimpleUploadedFile(name, file.getvalue(), content_type='image/png')
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ThumbnailTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+        self.client_author = self.login(self.author)
+        self.post = Post.objects.create(
+            text="золотая осень", author=self.author, image=make_image()
+        )
+        self.url = reverse('post', kwargs={
+            'username': 'gogol', 'post_id': self.post.id
+        })
+
+    def test_placeholder_until_ready(self):
+        """Страница не строит миниатюру сама, а показывает заглушку"""
+        response = self.client_author.get(self.url)
+        self.assertContains(response, "card-img-pending")
+        self.assertIsNone(thumbnails.lookup(self.post.image, "card"))
+
+        thumbnails.generate(self.post.image.name)
+        thumbnail = thumbnails.lookup(self.post.image, "card")
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        response = self.client_author.get(self.url)
+        self.assertNotContains(response, "card-img-pending")
+        self.assertContains(response, thumbnail.url)
+
+    def test_variants(self):
+        """Варианты ширин в WebP и JPEG сохраняются с постом и попадают
+        в srcset"""
+        thumbnails.generate(self.post.image.name)
+        self.post.refresh_from_db()
+        variants = self.post.variants
+        self.assertEqual(set(variants), {"webp", "jpeg"})
+        self.assertEqual(
+            [(v["width"], v["height"]) for v in variants["webp"]],
+            [(320, 113), (640, 226), (960, 339)],
+        )
+        self.assertTrue(variants["webp"][0]["name"].endswith(".webp"))
+        response = self.client_author.get(self.url)
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, thumbnails.srcset(variants["jpeg"]))
+        self.assertContains(response, 'sizes="')
+
+    def test_build_command(self):
+        """Команда строит общую картинку нескольких постов один раз"""
+        Post.objects.create(
+            text="вторая осень", author=self.author,
+            image=self.post.image.name
+        )
+        out = StringIO()
+        with mock.patch.object(thumbnails, "generate") as generate:
+            call_command("build_image_variants", stdout=out)
+        generate.assert_called_once_with(self.post.image.name)
+        self.assertIn("Обработано картинок: 1", out.getvalue())
+
+    def test_upload_schedules_generation(self):
+        """Новая картинка ставится в очередь, правка текста — нет"""
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            self.client_author.post(
+                reverse('new_post'),
+                {"text": "март", "image": make_image("march.png")}
+            )
+            self.assertEqual(schedule.call_count, 1)
+            self.client_author.post(
+                reverse('edit_post', kwargs={
+                    'username': 'gogol', 'post_id': self.post.id
+                }),
+                {"text": "осень"}
+            )
+            self.assertEqual(schedule.call_count, 1)
+
+
+class ImageIngestTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+        self.client_author = self.login(self.author)
+
+    def upload(self, image):
+        return self.client_author.post(
+            reverse('new_post'), {"text": "утро", "image": image}
+        )
+
+    def test_downscale_and_strip_exif(self):
+        """Большой оригинал уменьшается и теряет EXIF"""
+        exif = Image.Exif()
+        exif[0x010f] = "Camera"
+        file = BytesIO()
+        Image.new('RGB', (3000, 1000)).save(file, 'jpeg', exif=exif)
+        self.upload(SimpleUploadedFile(
+            "pine.jpeg", file.getvalue(), content_type='image/jpeg'
+        ))
+        post = Post.objects.get(author=self.author)
+        self.assertTrue(post.image.name.endswith(".jpg"))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (2048, 683))
+            self.assertFalse(image.getexif())
+
+    @override_settings(IMAGE_MAX_SIDE=50)
+    def test_animation(self):
+        """Анимация уменьшается покадрово и теряет метаданные"""
+        frames = [
+            Image.new('RGB', (200, 100), color) for color in ("red", "blue")
+        ]
+        file = BytesIO()
+        frames[0].save(
+            file, 'gif', save_all=True, append_images=frames[1:],
+            duration=[40, 80], loop=0, comment=b"camera"
+        )
+        self.upload(SimpleUploadedFile(
+            "wind.gif", file.getvalue(), content_type='image/gif'
+        ))
+        post = Post.objects.get(author=self.author)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 25))
+            self.assertEqual(image.n_frames, 2)
+            self.assertNotIn("comment", image.info)
+
+    @override_settings(IMAGE_MAX_PIXELS=100 * 99)
+    def test_too_many_pixels(self):
+        """Разрешение проверяется по заголовку до сохранения"""
+        response = self.upload(make_image(size=(100, 100)))
+        self.assertFormError(
+            response, "form", "image",
+            "Слишком большое разрешение изображения"
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_MAX_UPLOAD_SIZE=10)
+    def test_too_large_file(self):
+        """Слишком большой файл отклоняется"""
+        response = self.upload(make_image())
+        self.assertFormError(response, "form", "image", "Файл слишком большой")
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ThumbnailGarbageTest(BaseTest):
+    run_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+        self.post = self.create_post()
+
+    def create_post(self, image=None):
+        post = Post.objects.create(
+            text="грачи прилетели", author=self.author,
+            image=image or make_image(),
+        )
+        thumbnails.generate(post.image.name)
+        post.refresh_from_db()
+        return post
+
+    def thumbnail_files(self, post):
+        return [
+            variant["name"]
+            for variants in post.variants.values() for variant in variants
+        ]
+
+    def test_delete_post(self):
+        """Удаление поста удаляет его миниатюры"""
+        files = self.thumbnail_files(self.post)
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+        self.post.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in files))
+
+    def test_replace_image(self):
+        """Замена картинки удаляет миниатюры старой"""
+        files = self.thumbnail_files(self.post)
+        self.post.image = make_image("spring.png", color=(0, 155, 0))
+        self.post.save()
+        self.assertFalse(any(default_storage.exists(name) for name in files))
+
+    def test_shared_image_kept(self):
+        """Миниатюры картинки, нужной другому посту, остаются"""
+        other = self.create_post(image=self.post.image.name)
+        files = self.thumbnail_files(other)
+        self.post.delete()
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+
+    def test_duplicate_upload(self):
+        """Одинаковые загрузки делят файл и готовые варианты, а файл
+        удаляется вместе с последним постом"""
+        other = Post.objects.create(
+            text="дубль", author=self.author, image=make_image("copy.png")
+        )
+        self.assertEqual(other.image.name, self.post.image.name)
+        self.assertRegex(
+            other.image.name, r"^posts/[0-9a-f]{2}/[0-9a-f]{64}\.png$"
+        )
+        with mock.patch.object(thumbnails, "submit") as submit:
+            thumbnails.schedule(other)
+        submit.assert_not_called()
+        other.refresh_from_db()
+        self.assertEqual(other.variants, self.post.variants)
+
+        name = self.post.image.name
+        self.post.delete()
+        self.assertTrue(default_storage.exists(name))
+        other.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_collect(self):
+        """Команда находит сирот, записи без файлов и лишние файлы"""
+        orphan = self.create_post(image=make_image(color=(0, 0, 155)))
+        orphan_files = self.thumbnail_files(orphan)
+        Post.objects.filter(pk=orphan.pk).update(image="")
+        missing = self.thumbnail_files(self.post)[0]
+        default_storage.delete(missing)
+        stray = default_storage.save("cache/00/stray.jpg", BytesIO(b"x"))
+
+        report = thumbnail_gc.collect(dry_run=True)
+        self.assertEqual(report.orphan_sources, [orphan.image.name])
+        self.assertEqual(report.missing_files, [missing])
+        self.assertEqual(report.stray_files, [stray])
+        self.assertTrue(default_storage.exists(stray))
+
+        out = StringIO()
+        call_command("cleanup_thumbnails", batch_size=1, stdout=out)
+        self.assertIn("источников без постов 1", out.getvalue())
+        self.assertFalse(default_storage.exists(stray))
+        self.assertFalse(
+            any(default_storage.exists(name) for name in orphan_files)
+        )
+        report = thumbnail_gc.collect(dry_run=True)
+        self.assertEqual(
+            (report.orphan_sources, report.missing_files, report.stray_files),
+            ([], [], []),
+        )
+        self.assertIsNotNone(thumbnails.lookup(self.post.image, "card"))
+
+    def test_collect_rebuilds_variants(self):
+        """Пропавшие варианты сбрасываются у поста и строятся заново"""
+        missing = self.thumbnail_files(self.post)[0]
+        default_storage.delete(missing)
+        version = self.post.version
+        with mock.patch.object(thumbnails, "submit") as submit:
+            thumbnail_gc.collect()
+        submit.assert_called_once_with(self.post.image.name)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_variants, "")
+        self.assertGreater(self.post.version, version)
+
+    def test_release_pinned(self):
+        """Файл незафиксированной загрузки не удаляется"""
+        name = self.post.image.name
+        Post.objects.filter(pk=self.post.pk).update(image="")
+        with mock.patch.object(transaction, "on_commit"):
+            self.post.image.storage.save("posts/copy.png", make_image())
+        self.assertFalse(thumbnail_gc.release(name))
+        self.assertTrue(default_storage.exists(name))
+        cache.delete(storage.pin_key(name))
+        self.assertTrue(thumbnail_gc.release(name))
+        self.assertFalse(default_storage.exists(name))
+
+    def test_lock_timeout(self):
+        """Без блокировки файл не трогается, а чужая не снимается"""
+        name = self.post.image.name
+        Post.objects.filter(pk=self.post.pk).update(image="")
+        cache.add(f"image_lock:{name}", "чужая", 60)
+        with mock.patch.object(storage, "LOCK_TIMEOUT", 0):
+            with self.assertRaises(TimeoutError):
+                with storage.image_lock(name):
+                    pass
+            self.assertFalse(thumbnail_gc.release(name))
+        self.assertEqual(cache.get(f"image_lock:{name}"), "чужая")
+        self.assertTrue(default_storage.exists(name))
+
+
+class SearchTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(
+            text="Дама с собачкой гуляла по набережной",
+            author=self.author, group=self.group,
+        )
+
+    def found(self, query):
+        return list(search.matching(Post.objects.all(), query))
+
+    def test_match(self):
+        """Поиск по словам текста, префиксу, сообществу и автору"""
+        for query in ("собачкой", "набереж", "повести", "GOGOL",
+                      "дама гуляла"):
+            self.assertEqual(self.found(query), [self.post], query)
+        self.assertEqual(self.found("кошкой"), [])
+        self.assertEqual(self.found('"AND OR (*'), [])
+
+    def test_many_matches(self):
+        """Находятся все подходящие посты, а не только первый"""
+        others = [
+            Post.objects.create(text=f"Дама {number}", author=self.author)
+            for number in range(3)
+        ]
+        self.assertCountEqual(self.found("дама"), [self.post, *others])
+        self.assertEqual(
+            search.matching(Post.objects.all(), "дама").count(), 4
+        )
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке поста, сообщества и удалении"""
+        self.post.text = "Крыжовник"
+        self.post.save()
+        self.assertEqual(self.found("собачкой"), [])
+        self.assertEqual(self.found("крыжовник"), [self.post])
+        self.group.title = "Рассказы"
+        self.group.save()
+        self.assertEqual(self.found("рассказы"), [self.post])
+        self.group.delete()
+        self.assertEqual(self.found("рассказы"), [])
+        self.author.username = "antosha"
+        self.author.save()
+        self.assertEqual(self.found("antosha"), [self.post])
+        self.post.delete()
+        self.assertEqual(self.found("крыжовник"), [])
+
+    def test_ranking_and_pages(self):
+        """Результаты упорядочены по bm25 и листаются курсором"""
+        best = Post.objects.create(
+            text="собачкой собачкой собачкой", author=self.author
+        )
+        for number in range(14):
+            Post.objects.create(
+                text=f"собачкой и ещё много других слов {number}",
+                author=self.author,
+            )
+        response = self.client.get(reverse('search'), {"q": "собачкой"})
+        page = response.context["page"]
+        self.assertEqual(page[0], best)
+        self.assertEqual(len(page), 10)
+        self.assertContains(response, "q=%D1%81%D0%BE%D0%B1")
+
+        seen = list(page)
+        next_page = self.client.get(
+            reverse('search'), {"q": "собачкой", "cursor": page.next_cursor}
+        ).context["page"]
+        seen += list(next_page)
+        self.assertEqual(len(set(seen)), 16)
+        self.assertFalse(next_page.has_next())
+        previous = self.client.get(reverse('search'), {
+            "q": "собачкой", "cursor": next_page.previous_cursor
+        }).context["page"]
+        self.assertEqual(list(previous), list(page))
+
+    def test_admin_uses_index(self):
+        """Поиск в админке идёт через индекс"""
+        admin = User.objects.create_superuser("admin", "a@a.ru", "pass")
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/admin/posts/post/", {"q": "собачкой"}
+            )
+        self.assertContains(response, "Дама с собачкой")
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertIn("MATCH", sql)
+        self.assertNotIn("LIKE", sql)
+
+
+@override_settings(COMMENTS_PER_PAGE=20)
+class CommentPagesTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(text="Нос", author=self.author)
+        self.url = reverse('post', kwargs={
+            'username': 'gogol', 'post_id': self.post.id
+        })
+        self.fragment_url = reverse('post_comments', kwargs={
+            'username': 'gogol', 'post_id': self.post.id
+        })
+
+    def add_comments(self, count, prefix="reader"):
+        readers = [
+            User.objects.create_user(username=f"{prefix}{number}")
+            for number in range(count)
+        ]
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=reader, text=f"отзыв {number}")
+            for number, reader in enumerate(readers)
+        )
+
+    def test_pages(self):
+        """Первая страница выводится сразу, остальные — фрагментами"""
+        self.add_comments(45)
+        response = self.client.get(self.url)
+        first = list(response.context["comments"])
+        self.assertEqual(len(first), 20)
+        self.assertContains(response, "Показать ещё")
+
+        cursor = response.context["comments"].next_cursor
+        seen = first
+        while cursor:
+            response = self.client.get(self.fragment_url, {"cursor": cursor})
+            self.assertTemplateUsed(response, "includes/comment_list.html")
+            seen += list(response.context["comments"])
+            cursor = response.context["comments"].next_cursor
+        self.assertEqual(len(set(seen)), 45)
+        self.assertNotContains(response, "Показать ещё")
+        self.assertEqual(
+            seen, list(self.post.comments.order_by("-created", "-pk"))
+        )
+
+    def test_authors_joined(self):
+        """Число запросов страницы не зависит от числа комментариев"""
+        self.add_comments(2)
+        # Метки свежести строятся первым запросом и дальше берутся из кеша.
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        self.add_comments(15, prefix="guest")
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url)
+        self.assertEqual(len(many), len(few))
+
+
+class FollowGraphTest(BaseTest):
+    run_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        self.pushkin, self.lermontov = (
+            User.objects.create_user(username=name)
+            for name in ("pushkin", "lermontov")
+        )
+        Follow.objects.create(user=self.author, author=self.pushkin)
+        Follow.objects.create(user=self.pushkin, author=self.author)
+        Follow.objects.create(user=self.lermontov, author=self.pushkin)
+
+    def test_queries(self):
+        """Граф отвечает на вопросы о подписках без запросов к базе"""
+        graph = follow_graph.get_graph()
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                graph.is_following(self.author.id, self.pushkin.id)
+            )
+            self.assertFalse(
+                graph.is_following(self.pushkin.id, self.lermontov.id)
+            )
+            self.assertEqual(graph.followers_count(self.pushkin.id), 2)
+            self.assertEqual(graph.following_count(self.lermontov.id), 1)
+            self.assertEqual(
+                graph.followers(self.pushkin.id),
+                tuple(sorted((self.author.id, self.lermontov.id))),
+            )
+            self.assertEqual(graph.mutuals(self.pushkin.id), [self.author.id])
+
+    def test_incremental_updates(self):
+        """Изменения из другого процесса проигрываются из журнала"""
+        graph = follow_graph.get_graph()
+        # Подписки оформляет «другой процесс» без графа в памяти.
+        follow_graph._graph = None
+        Follow.objects.create(user=self.pushkin, author=self.lermontov)
+        Follow.objects.filter(user=self.author).delete()
+        follow_graph._graph = graph
+        with self.assertNumQueries(0):
+            self.assertIs(follow_graph.get_graph(), graph)
+        self.assertTrue(graph.is_following(self.pushkin.id, self.lermontov.id))
+        self.assertFalse(graph.is_following(self.author.id, self.pushkin.id))
+        self.assertEqual(follow_graph.check(), ([], [], []))
+
+        # Без журнала граф перечитывается из базы.
+        follow_graph._graph = None
+        Follow.objects.create(user=self.author, author=self.lermontov)
+        cache.delete(follow_graph.change_key(cache.get(
+            follow_graph.GENERATION_KEY
+        )))
+        follow_graph._graph = graph
+        fresh = follow_graph.get_graph()
+        self.assertIsNot(fresh, graph)
+        self.assertTrue(fresh.is_following(self.author.id, self.lermontov.id))
+
+    def test_views(self):
+        """Профиль и подписка используют граф"""
+        client = self.login(self.pushkin)
+        profile = reverse('profile', kwargs={'username': 'lermontov'})
+        self.assertFalse(client.get(profile).context["following"])
+        client.get(reverse(
+            'profile_follow', kwargs={'username': 'lermontov'}
+        ))
+        self.assertTrue(client.get(profile).context["following"])
+        client.get(reverse(
+            'profile_unfollow', kwargs={'username': 'lermontov'}
+        ))
+        self.assertFalse(client.get(profile).context["following"])
+        self.assertFalse(Follow.objects.filter(
+            user=self.pushkin, author=self.lermontov
+        ).exists())
+
+    def test_rollback(self):
+        """Откат не оставляет ребро в графе, а подписка пишется в базу,
+        даже если граф уже считает её оформленной"""
+        graph = follow_graph.get_graph()
+        # Отложенные действия откатанной транзакции не выполняются.
+        with mock.patch.object(transaction, "on_commit", lambda f: None):
+            with self.assertRaises(DatabaseError):
+                with transaction.atomic():
+                    Follow.objects.create(
+                        user=self.pushkin, author=self.lermontov
+                    )
+                    raise DatabaseError("database is locked")
+        self.assertFalse(
+            graph.is_following(self.pushkin.id, self.lermontov.id)
+        )
+        graph.add(self.author.id, self.lermontov.id)
+        views.follow(self.author, self.lermontov)
+        self.assertTrue(Follow.objects.filter(
+            user=self.author, author=self.lermontov
+        ).exists())
+
+    def test_check_command(self):
+        """Проверка находит расхождение, а --repair его исправляет"""
+        follow_graph.get_graph().add(self.pushkin.id, self.lermontov.id)
+        with self.assertRaises(CommandError):
+            call_command("check_follow_graph", stdout=StringIO())
+        call_command("check_follow_graph", repair=True, stdout=StringIO())
+        self.assertEqual(follow_graph.check(), ([], [], []))
+
+
+class RecommendationsTest(BaseTest):
+    run_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        self.critic, self.novelist, self.essayist = (
+            User.objects.create_user(username=name)
+            for name in ("critic", "novelist", "essayist")
+        )
+        Post.objects.create(text="Нос", author=self.author, group=self.group)
+        Post.objects.create(
+            text="Эссе", author=self.essayist, group=self.group
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.critic, author=self.author)
+        Follow.objects.create(user=self.critic, author=self.novelist)
+
+    def test_scores(self):
+        """Совместные подписки и близость по сообществам дают оценку"""
+        recommendations.build(User.objects.values_list("pk", flat=True))
+        self.assertEqual(
+            list(Recommendation.objects.filter(user=self.reader)
+                 .order_by("-score").values_list("author", "score")),
+            [(self.essayist.pk, 2.0), (self.novelist.pk, 1.0)],
+        )
+        self.assertEqual(
+            recommendations.for_user(self.reader),
+            [self.essayist, self.novelist],
+        )
+
+    def test_incremental(self):
+        """Пересчитываются только пользователи, чьи подписки менялись"""
+        recommendations.build(recommendations.stale_users())
+        self.assertFalse(recommendations.stale_users().exists())
+        Follow.objects.create(user=self.reader, author=self.novelist)
+        self.assertEqual(
+            list(recommendations.stale_users()), [self.reader.pk]
+        )
+        # До пересчёта новая подписка отсеивается при чтении.
+        self.assertEqual(
+            recommendations.for_user(self.reader), [self.essayist]
+        )
+        call_command("build_recommendations", stdout=StringIO())
+        self.assertFalse(recommendations.stale_users().exists())
+        self.assertFalse(Recommendation.objects.filter(
+            user=self.reader, author=self.novelist
+        ).exists())
+
+    def test_follow_during_build(self):
+        """Подписка, оформленная во время расчёта, не теряется"""
+        recommend = recommendations.recommend
+
+        def follow_meanwhile(graph, groups, user_id):
+            if user_id == self.reader.pk:
+                recommendations.mark_stale(self.reader.pk)
+            return recommend(graph, groups, user_id)
+
+        with mock.patch.object(
+            recommendations, "recommend", follow_meanwhile
+        ):
+            recommendations.build(User.objects.values_list("pk", flat=True))
+        self.assertEqual(
+            list(recommendations.stale_users()), [self.reader.pk]
+        )
+
+    def test_partial_graph(self):
+        """Для расчёта загружаются только нужные подписки"""
+        Follow.objects.create(user=self.essayist, author=self.novelist)
+        graph = recommendations.load_graph([self.reader.pk])
+        self.assertEqual(graph.following(self.reader.pk), (self.author.pk,))
+        self.assertEqual(
+            set(graph.following(self.critic.pk)),
+            {self.author.pk, self.novelist.pk},
+        )
+        self.assertEqual(graph.following(self.essayist.pk), ())
+        with self.settings(RECOMMENDATIONS_MAX_FOLLOWERS=1):
+            graph = recommendations.load_graph([self.reader.pk])
+        self.assertEqual(graph.following(self.critic.pk), (self.author.pk,))
+
+    def test_pages(self):
+        """Профиль и лента подписок показывают сохранённый список"""
+        recommendations.build(User.objects.values_list("pk", flat=True))
+        response = self.client_reader.get(reverse("follow_index"))
+        self.assertEqual(
+            response.context["recommended"], [self.essayist, self.novelist]
+        )
+        self.assertContains(response, "@essayist")
+        response = self.client_reader.get(
+            reverse("profile", kwargs={"username": "essayist"})
+        )
+        self.assertEqual(response.context["recommended"], [self.novelist])
+
+
+class AjaxEndpointsTest(BaseTest):
+    run_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(text="Нос", author=self.author)
+        self.client.force_login(self.reader)
+        self.follow_url = reverse(
+            "profile_follow_ajax", kwargs={"username": "gogol"}
+        )
+        self.unfollow_url = reverse(
+            "profile_unfollow_ajax", kwargs={"username": "gogol"}
+        )
+        self.comment_url = reverse("add_comment_ajax", kwargs={
+            "username": "gogol", "post_id": self.post.id
+        })
+
+    def test_follow(self):
+        """Подписка и отписка отвечают состоянием вместо редиректа"""
+        response = self.client.post(self.follow_url)
+        self.assertEqual(
+            response.json(), {"following": True, "followers_count": 1}
+        )
+        # Повторный запрос не создаёт вторую подписку.
+        response = self.client.post(self.follow_url)
+        self.assertEqual(response.json()["followers_count"], 1)
+        self.assertEqual(Follow.objects.count(), 1)
+
+        response = self.client.post(self.unfollow_url)
+        self.assertEqual(
+            response.json(), {"following": False, "followers_count": 0}
+        )
+        self.assertFalse(Follow.objects.exists())
+
+    def test_follow_rejected(self):
+        """Только POST, не на себя и не анонимно"""
+        self.assertEqual(self.client.get(self.follow_url).status_code, 405)
+        response = self.client.post(reverse(
+            "profile_follow_ajax", kwargs={"username": "reader"}
+        ))
+        self.assertEqual(response.status_code, 400)
+        response = Client().post(self.follow_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_comment(self):
+        """Ответ содержит только новый комментарий"""
+        response = self.client.post(self.comment_url, {"text": "Чудно!"})
+        self.assertEqual(response.status_code, 201)
+        self.assertTemplateUsed(response, "includes/comment.html")
+        comment = Comment.objects.get()
+        self.assertContains(
+            response, f'name="comment_{comment.id}"', status_code=201
+        )
+        self.assertContains(response, "Чудно!", status_code=201)
+        self.assertNotContains(response, "Нос", status_code=201)
+
+        response = self.client.post(self.comment_url, {"text": ""})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("text", response.json()["errors"])
+        self.assertEqual(Comment.objects.count(), 1)
+
+
+class FeedApiTest(BaseTest):
+    run_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        self.posts = self.add_posts(25)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        self.urls = (
+            reverse("api_index"),
+            reverse("api_group", kwargs={"slug": "stories"}),
+            reverse("api_profile", kwargs={"username": "gogol"}),
+            reverse("api_follow_index"),
+        )
+
+    def test_pages(self):
+        """Ленты листаются курсором до конца"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                seen = [post["id"] for post in response.json()["results"]]
+                self.assertIsNone(response.json()["previous"])
+                response = self.client.get(response.json()["next"])
+                seen += [post["id"] for post in response.json()["results"]]
+                self.assertIsNone(response.json()["next"])
+                self.assertEqual(
+                    seen, [post.pk for post in reversed(self.posts)]
+                )
+        first = self.client.get(self.urls[0]).json()["results"][0]
+        self.assertEqual(first["author"], "gogol")
+        self.assertEqual(first["group"], "stories")
+        self.assertEqual(first["text"], "повесть 24")
+
+    def test_not_modified(self):
+        """Совпавший ETag даёт 304 без запроса ленты"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(any(
+                    "posts_post" in query["sql"] for query in queries
+                ))
+
+    def test_etag_changes(self):
+        """Новый пост, правка, комментарий и подписка меняют ETag"""
+        changes = (
+            lambda: Post.objects.create(text="Нос", author=self.author),
+            lambda: self.posts[0].save(),
+            lambda: Comment.objects.create(
+                post=self.posts[0], author=self.reader, text="!"
+            ),
+            lambda: Follow.objects.filter(user=self.reader).delete(),
+        )
+        url = reverse("api_follow_index")
+        etag = self.client.get(url)["ETag"]
+        for change in changes:
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+            etag = response["ETag"]
+
+    def test_scopes(self):
+        """Пост чужого автора не сбрасывает ETag профиля"""
+        url = reverse("api_profile", kwargs={"username": "gogol"})
+        etag = self.client.get(url)["ETag"]
+        Post.objects.create(text="Чужой", author=self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_anonymous_follow(self):
+        response = Client().get(reverse("api_follow_index"))
+        self.assertEqual(response.status_code, 401)
+
+
+class ConditionalPagesTest(BaseTest):
+    run_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(
+            text="Нос", author=self.author, group=self.group
+        )
+        self.urls = {
+            "post": reverse("post", kwargs={
+                "username": "gogol", "post_id": self.post.id
+            }),
+            "profile": reverse("profile", kwargs={"username": "gogol"}),
+            "group": reverse("group", kwargs={"slug": "stories"}),
+        }
+
+    def test_not_modified(self):
+        """Повторный запрос получает 304 без рендера шаблона"""
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                etag = self.client.get(url)["ETag"]
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.templates)
+                self.assertLessEqual(len(queries), 1)
+
+    def test_last_modified(self):
+        """If-Modified-Since работает, когда метка старше секунды"""
+        url = self.urls["profile"]
+        with mock.patch("time.time", return_value=1000.5):
+            response = self.client.get(url)
+        self.assertFalse(response.has_header("Last-Modified"))
+        with mock.patch("time.time", return_value=1002.0):
+            response = self.client.get(url)
+            modified = response["Last-Modified"]
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes(self):
+        """Комментарий, правка и подписка меняют ETag нужных страниц"""
+        client = self.client_reader
+        etags = {
+            name: client.get(url)["ETag"] for name, url in self.urls.items()
+        }
+
+        def changed():
+            result = {
+                name: client.get(url, HTTP_IF_NONE_MATCH=etags[name])
+                for name, url in self.urls.items()
+            }
+            etags.update(
+                (name, response["ETag"])
+                for name, response in result.items()
+                if response.status_code == 200
+            )
+            return {
+                name for name, response in result.items()
+                if response.status_code == 200
+            }
+
+        Comment.objects.create(post=self.post, author=self.reader, text="!")
+        self.assertEqual(changed(), {"post", "profile", "group"})
+        Follow.objects.create(user=self.reader, author=self.author)
+        # Подписка меняет кнопку и счётчики у смотрящего на всех страницах.
+        self.assertEqual(changed(), {"post", "profile", "group"})
+        Post.objects.create(text="Другой", author=self.reader)
+        self.assertEqual(changed(), set())
+        self.group.save()
+        self.assertEqual(changed(), {"post", "profile", "group"})
+
+    def test_viewers(self):
+        """Разные пользователи не получают чужую страницу как 304"""
+        url = self.urls["profile"]
+        etag = self.client.get(url)["ETag"]
+        response = self.client_reader.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ArchiveTest(BaseTest):
+    run_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        self.posts = [
+            Post.objects.create(
+                text=f"повесть {number}", author=self.author,
+                group=self.group if number % 2 else None,
+            )
+            for number in range(7)
+        ]
+        Post.objects.filter(pk=self.posts[0].pk).update(
+            pub_date="2001-02-03T04:05:06Z"
+        )
+        Comment.objects.create(
+            post=self.posts[1], author=self.reader, text="Чудно!"
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def export(self):
+        out = StringIO()
+        call_command("export_content", chunk_size=2, stdout=out)
+        return out.getvalue()
+
+    def test_round_trip(self):
+        """Выгрузка и загрузка восстанавливают контент и его производные"""
+        dump = self.export()
+        self.assertEqual(len(dump.splitlines()), 1 + 7 + 1 + 1)
+        Group.objects.all().delete()
+        Post.objects.all().delete()
+        self.reader.delete()
+
+        path = tempfile.mkstemp(suffix=".jsonl")[1]
+        self.addCleanup(os.remove, path)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(dump)
+        out = StringIO()
+        call_command("import_content", path, batch_size=3, stdout=out)
+        self.assertIn("постов 7", out.getvalue())
+
+        self.assertEqual(
+            sorted(Post.objects.values_list("text", flat=True)),
+            [f"повесть {number}" for number in range(7)],
+        )
+        oldest = Post.objects.order_by("pub_date").first()
+        self.assertEqual(oldest.text, "повесть 0")
+        self.assertEqual(oldest.pub_date.year, 2001)
+        self.assertEqual(
+            Post.objects.filter(group__slug="stories").count(), 3
+        )
+        reader = User.objects.get(username="reader")
+        self.assertFalse(reader.has_usable_password())
+        commented = Post.objects.get(text="повесть 1")
+        self.assertEqual(commented.comments_count, 1)
+        self.assertEqual(commented.comments.get().author, reader)
+        self.assertTrue(
+            Follow.objects.filter(user=reader, author=self.author).exists()
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 7
+        )
+        self.assertEqual(timeline.feed(reader).count(), 7)
+        self.assertTrue(
+            follow_graph.get_graph().is_following(reader.pk, self.author.pk)
+        )
+        self.assertEqual(
+            search.matching(Post.objects.all(), "повесть").count(), 7
+        )
+        # Повторная загрузка не дублирует сообщества и подписки.
+        call_command("import_content", path, stdout=StringIO())
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_concurrent_post(self):
+        """Пост, созданный во время загрузки, не занимает её id"""
+        dump = self.export().splitlines(keepends=True)
+        parse = archive.parse_datetime
+
+        def post_meanwhile(value):
+            if not Post.objects.filter(text="тем временем").exists():
+                Post.objects.create(text="тем временем", author=self.reader)
+            return parse(value)
+
+        with mock.patch.object(archive, "parse_datetime", post_meanwhile):
+            counts = archive.import_lines(dump)
+        self.assertEqual(counts["post"], 7)
+        self.assertEqual(
+            Comment.objects.filter(post__text="повесть 1").count(), 2
+        )
+
+    def test_download(self):
+        """Архив пользователя отдаётся потоком только ему самому"""
+        client = self.login(self.author)
+        url = reverse("profile_archive", kwargs={"username": "gogol"})
+        response = client.get(url)
+        self.assertTrue(response.streaming)
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [row["model"] for row in rows],
+            ["group"] + ["post"] * 7 + ["comment"],
+        )
+
+        client.force_login(self.reader)
+        response = client.get(url)
+        self.assertRedirects(response, reverse(
+            "profile", kwargs={"username": "gogol"}
+        ))
+
+
+class SyndicationFeedTest(BaseTest):
+    run_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(
+            text="Нос", author=self.author, group=self.group
+        )
+        self.urls = {
+            "index": (reverse("index_rss"), reverse("index_atom")),
+            "group": (
+                reverse("group_rss", kwargs={"slug": "stories"}),
+                reverse("group_atom", kwargs={"slug": "stories"}),
+            ),
+            "author": (
+                reverse("author_rss", kwargs={"username": "gogol"}),
+                reverse("author_atom", kwargs={"username": "gogol"}),
+            ),
+        }
+
+    def test_feeds(self):
+        """RSS и Atom отдают записи всех, сообщества и автора"""
+        for name, (rss, atom) in self.urls.items():
+            with self.subTest(feed=name):
+                response = self.client.get(rss)
+                self.assertEqual(
+                    response["Content-Type"],
+                    "application/rss+xml; charset=utf-8",
+                )
+                self.assertContains(response, "<title>Нос</title>")
+                response = self.client.get(atom)
+                self.assertTrue(response["Content-Type"].startswith(
+                    "application/atom+xml"
+                ))
+                self.assertContains(response, "<title>Нос</title>")
+        other = User.objects.create_user(username="chekhov")
+        Post.objects.create(text="Крыжовник", author=other)
+        self.assertNotContains(
+            self.client.get(self.urls["group"][0]), "Крыжовник"
+        )
+        self.assertNotContains(
+            self.client.get(self.urls["author"][0]), "Крыжовник"
+        )
+        self.assertContains(
+            self.client.get(self.urls["index"][0]), "Крыжовник"
+        )
+
+    def test_incremental_entries(self):
+        """Новый пост дописывается в закешированный список без запроса"""
+        self.client.get(self.urls["author"][0])
+        newer = Post.objects.create(text="Шинель", author=self.author)
+        entries = cache.get(feeds.entries_key(f"author:{self.author.pk}"))
+        self.assertEqual(
+            [entry["id"] for entry in entries], [newer.pk, self.post.pk]
+        )
+        newer.text = "Шинель, вторая редакция"
+        newer.save()
+        self.assertContains(
+            self.client.get(self.urls["author"][0]), "вторая редакция"
+        )
+        self.author.username = "nikolai"
+        self.author.save()
+        response = self.client.get(reverse("index_rss"))
+        self.assertContains(response, "/nikolai/")
+
+    def test_conditional(self):
+        """If-Modified-Since и If-None-Match получают 304 без запросов"""
+        url = self.urls["group"][1]
+        with mock.patch("time.time", return_value=1000.5):
+            self.client.get(url)
+        with mock.patch("time.time", return_value=1002.0):
+            response = self.client.get(url)
+            with self.assertNumQueries(1):
+                cached = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+                )
+            self.assertEqual(cached.status_code, 304)
+            with self.assertNumQueries(1):
+                cached = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response["ETag"]
+                )
+            self.assertEqual(cached.status_code, 304)
+            Post.objects.create(
+                text="Шинель", author=self.author, group=self.group
+            )
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Шинель")
+
+    def test_comments_keep_etag(self):
+        """Комментарии не меняют ETag лент, но меняют ETag страниц"""
+        group_page = reverse("group", kwargs={"slug": "stories"})
+        feed = self.client.get(self.urls["group"][0])
+        page = self.client.get(group_page)
+        comment = Comment.objects.create(
+            post=self.post, author=self.author, text="Где нос?"
+        )
+        comment.delete()
+        self.assertEqual(
+            self.client.get(self.urls["group"][0])["ETag"], feed["ETag"]
+        )
+        self.assertNotEqual(
+            self.client.get(group_page)["ETag"], page["ETag"]
+        )
+
+    def test_rollback(self):
+        """Пост из откаченной транзакции не попадает в списки"""
+        self.client.get(self.urls["author"][0])
+        commits = []
+        with mock.patch.object(transaction, "on_commit", commits.append):
+            feeds.note_post(
+                Post(pk=1000, text="Черновик", author=self.author)
+            )
+        self.assertNotContains(
+            self.client.get(self.urls["author"][0]), "Черновик"
+        )
+
+    def test_site_name(self):
+        """Заголовки лент берут название сайта из настроек"""
+        with self.settings(SITE_NAME="Журнал"):
+            response = self.client.get(self.urls["group"][1])
+        self.assertContains(response, "<title>Журнал: Повести</title>")
@@ -0,0 +1,149 @@
+"""Удаление картинок и миниатюр, на которые не ссылается ни один пост."""
+import os
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import freshness, thumbnails
+from .models import Post
+from .page_cache import invalidate
+from .storage import image_lock, is_pinned
+
+
+class Report:
+    def __init__(self):
+        self.orphan_sources = []
+        self.missing_files = []
+        self.stray_files = []
+
+
+def referenced_images():
+    return set(
+        Post.objects.exclude(image="").exclude(image__isnull=True)
+        .values_list("image", flat=True).iterator()
+    )
+
+
+def release(name):
+    """Удаляет картинку и её миниатюры, если она больше не нужна постам."""
+    if not name:
+        return False
+    try:
+        with image_lock(name):
+            if is_pinned(name) or Post.objects.filter(image=name).exists():
+                return False
+            default.kvstore.delete(ImageFile(name, default.storage))
+            try:
+                Post._meta.get_field("image").storage.delete(name)
+            except SuspiciousFileOperation:
+                # Имя указывает за пределы MEDIA_ROOT: такой файл не наш.
+                pass
+    except TimeoutError:
+        # Файл остаётся до следующего cleanup_thumbnails.
+        return False
+    return True
+
+
+def _walk(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield f"{path}{name}"
+    for directory in directories:
+        yield from _walk(storage, f"{path}{directory}/")
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def collect(dry_run=False, batch_size=500):
+    """Находит сирот, записи без файлов и лишние файлы миниатюр."""
+    kvstore, storage = default.kvstore, default.storage
+    report = Report()
+    referenced = referenced_images()
+    owned = set()
+    keys = list(kvstore._find_keys(identity="thumbnails"))
+    for chunk in _chunks(keys, batch_size):
+        with transaction.atomic():
+            for key in chunk:
+                _check_source(key, referenced, owned, report, dry_run)
+
+    prefix = thumbnail_settings.THUMBNAIL_PREFIX
+    if storage.exists(prefix):
+        report.stray_files = [
+            name for name in _walk(storage, prefix) if name not in owned
+        ]
+    if not dry_run:
+        for chunk in _chunks(report.stray_files, batch_size):
+            for name in chunk:
+                storage.delete(name)
+        _remove_empty_directories(storage, prefix)
+    return report
+
+
+def _check_source(key, referenced, owned, report, dry_run):
+    kvstore = default.kvstore
+    source = kvstore._get(key)
+    thumbnail_keys = kvstore._get(key, identity="thumbnails") or []
+    images = {
+        thumbnail_key: kvstore._get(thumbnail_key)
+        for thumbnail_key in thumbnail_keys
+    }
+    images = {
+        thumbnail_key: image
+        for thumbnail_key, image in images.items() if image
+    }
+    owned.update(image.name for image in images.values())
+    if source is None or source.name not in referenced:
+        report.orphan_sources.append(source.name if source else key)
+        if not dry_run:
+            for image in images.values():
+                kvstore.delete(image, delete_thumbnails=False)
+                image.delete()
+            kvstore._delete(key, identity="thumbnails")
+            if source is not None:
+                kvstore.delete(source, delete_thumbnails=False)
+        return
+    missing = {
+        thumbnail_key for thumbnail_key, image in images.items()
+        if not image.exists()
+    }
+    report.missing_files.extend(
+        images[thumbnail_key].name for thumbnail_key in missing
+    )
+    if dry_run or not missing:
+        return
+    for thumbnail_key in missing:
+        kvstore.delete(images[thumbnail_key], delete_thumbnails=False)
+    remaining = [
+        thumbnail_key for thumbnail_key in images
+        if thumbnail_key not in missing
+    ]
+    kvstore._set(key, remaining, identity="thumbnails")
+    _reset_variants(source.name)
+
+
+def _reset_variants(name):
+    """Сбрасывает варианты постов с картинкой и строит их заново."""
+    posts = Post.objects.filter(image=name)
+    scopes = freshness.post_scopes(
+        *posts.values_list("pk", "author_id", "group_id")
+    )
+    posts.update(image_variants="", version=F("version") + 1)
+    freshness.touch(scopes)
+    invalidate("index_page")
+    transaction.on_commit(lambda: thumbnails.submit(name))
+
+
+def _remove_empty_directories(storage, prefix):
+    if not hasattr(storage, "path"):
+        return
+    root = storage.path(prefix)
+    for path, directories, files in os.walk(root, topdown=False):
+        if path != root and not os.listdir(path):
+            os.rmdir(path)
@@ -0,0 +1,178 @@
+"""Миниатюры и варианты картинок постов, построенные заранее в пуле."""
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults, settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+class LookupBackend(ThumbnailBackend):
+    def lookup(self, file_, geometry_string, **options):
+        """Возвращает готовую миниатюру или None, ничего не создавая."""
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault("format", self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = LookupBackend()
+
+
+def lookup(image, size):
+    if not image:
+        return None
+    geometry, options = settings.THUMBNAIL_SIZES[size]
+    # Миниатюры sorl привязаны к имени источника, а не к файлу поля.
+    return backend.lookup(getattr(image, "name", image), geometry, **options)
+
+
+def placeholder(size):
+    """Пустая SVG-картинка размера миниатюры, чтобы вёрстка не прыгала."""
+    geometry, _ = settings.THUMBNAIL_SIZES[size]
+    width, height = geometry.split("x")
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+        f'height="{height}"><rect width="100%" height="100%" '
+        f'fill="#e9ecef"/></svg>'
+    )
+    return "data:image/svg+xml," + quote(svg)
+
+
+def build_variants(name, size="card"):
+    """Строит варианты картинки с пропорциями размера ``size``."""
+    geometry, options = settings.THUMBNAIL_SIZES[size]
+    width, height = (int(side) for side in geometry.split("x"))
+    variants = {}
+    for image_format in settings.IMAGE_VARIANT_FORMATS:
+        variants[image_format.lower()] = [
+            _variant(
+                name, variant_width, round(height * variant_width / width),
+                dict(options, format=image_format),
+            )
+            for variant_width in settings.IMAGE_VARIANT_WIDTHS
+        ]
+    return variants
+
+
+def _variant(name, width, height, options):
+    image = get_thumbnail(name, f"{width}x{height}", **options)
+    return {"name": image.name, "width": image.width, "height": image.height}
+
+
+def url(name):
+    return default.storage.url(name)
+
+
+def srcset(variants):
+    return ", ".join(
+        f"{url(variant['name'])} {variant['width']}w"
+        for variant in variants
+    )
+
+
+def generate(name):
+    """Строит миниатюры и варианты, сбрасывает кеш карточек поста."""
+    from . import freshness, page_cache
+    from .models import Post
+
+    for geometry, options in settings.THUMBNAIL_SIZES.values():
+        get_thumbnail(name, geometry, **options)
+    posts = Post.objects.filter(image=name)
+    posts.update(
+        image_variants=json.dumps(build_variants(name)),
+        version=F("version") + 1,
+    )
+    page_cache.bump_generation("index_page")
+    freshness.touch(freshness.post_scopes(
+        *posts.values_list("pk", "author_id", "group_id")
+    ))
+
+
+def _init_worker():
+    # Соединения, унаследованные через fork, принадлежат родителю.
+    for connection in connections.all():
+        connection.connection = None
+
+
+def _report(future):
+    if future.exception() is not None:
+        logger.error(
+            "Не удалось построить миниатюры", exc_info=future.exception()
+        )
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS, initializer=_init_worker
+        )
+    return _executor
+
+
+def submit(name):
+    if not settings.THUMBNAIL_WORKERS:
+        generate(name)
+        return
+    get_executor().submit(generate, name).add_done_callback(_report)
+
+
+def submit_many(names):
+    """Ставит в очередь картинки импорта; возвращает их число."""
+    from .models import Post
+
+    storage = Post._meta.get_field("image").storage
+    queued = 0
+    for name in sorted(set(names)):
+        variants = Post.objects.filter(image=name).exclude(
+            image_variants=""
+        ).values_list("image_variants", flat=True).first()
+        if variants:
+            Post.objects.filter(image=name, image_variants="").update(
+                image_variants=variants, version=F("version") + 1
+            )
+        elif storage.exists(name):
+            transaction.on_commit(lambda name=name: submit(name))
+            queued += 1
+    return queued
+
+
+def schedule(post):
+    """Ставит картинку поста в очередь или копирует готовые варианты."""
+    from .models import Post
+
+    if not post.image:
+        return
+    name = post.image.name
+    variants = Post.objects.filter(image=name).exclude(
+        image_variants=""
+    ).values_list("image_variants", flat=True).first()
+    if variants:
+        from . import freshness
+
+        Post.objects.filter(pk=post.pk).update(
+            image_variants=variants, version=F("version") + 1
+        )
+        freshness.touch(freshness.post_scopes(
+            (post.pk, post.author_id, post.group_id)
+        ))
+        return
+    transaction.on_commit(lambda: submit(name))
@@ -0,0 +1,126 @@
+"""Ленты «Избранных авторов», разложенные по подписчикам при записи."""
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+
+def is_pull_author(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id, timeline_pull=True
+    ).exists()
+
+
+def pull_authors(user):
+    """Авторы из подписок пользователя, которые читаются в режиме pull."""
+    followed = Follow.objects.filter(user=user).values("author")
+    return UserStats.objects.filter(
+        user__in=followed, timeline_pull=True
+    ).values_list("user_id", flat=True)
+
+
+def _write(entries):
+    # bulk_create собрал бы все записи в один список.
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, settings.TIMELINE_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list("user_id", flat=True)
+    _write(
+        TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def _posts(author_id):
+    return Post.objects.filter(author_id=author_id).order_by().values_list(
+        "id", "pub_date"
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту посты автора после подписки."""
+    if is_pull_author(author_id):
+        return
+    _write(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in _posts(author_id).iterator()
+    )
+
+
+def _refill(author_id):
+    # Дубли уже разложенных постов отбрасываются ignore_conflicts.
+    posts = list(_posts(author_id))
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list("user_id", flat=True)
+    _write(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for user_id in followers.iterator()
+        for post_id, pub_date in posts
+    )
+
+
+def update_modes(author_ids):
+    """Переключает авторов между push и pull по числу подписчиков."""
+    threshold = settings.TIMELINE_PULL_THRESHOLD
+    UserStats.objects.filter(
+        user_id__in=author_ids, timeline_pull=False,
+        followers_count__gt=threshold
+    ).update(timeline_pull=True)
+    returned = list(UserStats.objects.filter(
+        user_id__in=author_ids, timeline_pull=True,
+        followers_count__lte=threshold
+    ).values_list("user_id", flat=True))
+    UserStats.objects.filter(user_id__in=returned).update(
+        timeline_pull=False
+    )
+    for author_id in returned:
+        _refill(author_id)
+
+
+def retract(user_id, author_id):
+    """Убирает посты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild(user_id):
+    # В одной транзакции: параллельное чтение не увидит пустую ленту.
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        authors = Follow.objects.filter(user_id=user_id).values_list(
+            "author_id", flat=True
+        )
+        for author_id in authors:
+            backfill(user_id, author_id)
+
+
+def feed(user):
+    """Посты ленты, от новых к старым по ``feed_date`` и ``feed_post``."""
+    pulled = list(pull_authors(user))
+    if not pulled:
+        posts = Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F("timeline_entries__pub_date"),
+            feed_post=F("timeline_entries__post"),
+        )
+    else:
+        pushed = TimelineEntry.objects.filter(user=user).values("post")
+        posts = Post.objects.filter(
+            Q(pk__in=pushed) | Q(author__in=pulled)
+        ).annotate(feed_date=F("pub_date"), feed_post=F("pk"))
+    return posts.order_by("-feed_date", "-feed_post")
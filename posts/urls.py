@@ -1,11 +1,24 @@
 from django.urls import path
-from . import views
+from . import api, feeds, views
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("new/", views.new_post, name="new_post"),
     path("group/<slug:slug>/", views.group_posts, name="group"),
+    path("rss/", feeds.index_rss, name="index_rss"),
+    path("atom/", feeds.index_atom, name="index_atom"),
+    path("group/<slug:slug>/rss/", feeds.group_rss, name="group_rss"),
+    path("group/<slug:slug>/atom/", feeds.group_atom, name="group_atom"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("search/", views.search_posts, name="search"),
+    path("api/v1/posts/", api.index, name="api_index"),
+    path("api/v1/follow/", api.follow_index, name="api_follow_index"),
+    path("api/v1/group/<slug:slug>/", api.group_posts, name="api_group"),
+    path(
+        "api/v1/profile/<str:username>/",
+        api.profile,
+        name="api_profile"
+    ),
     path(
         "<str:username>/follow/",
         views.profile_follow,
@@ -16,8 +29,30 @@ urlpatterns = [
         views.profile_unfollow,
         name="profile_unfollow"
     ),
+    path(
+        "<str:username>/follow/ajax/",
+        views.profile_follow_ajax,
+        name="profile_follow_ajax"
+    ),
+    path(
+        "<str:username>/unfollow/ajax/",
+        views.profile_unfollow_ajax,
+        name="profile_unfollow_ajax"
+    ),
+    path(
+        "<str:username>/archive/",
+        views.profile_archive,
+        name="profile_archive"
+    ),
+    path("<str:username>/rss/", feeds.author_rss, name="author_rss"),
+    path("<str:username>/atom/", feeds.author_atom, name="author_atom"),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         '<str:username>/<int:post_id>/edit/',
         views.post_edit,
@@ -28,4 +63,9 @@ urlpatterns = [
         views.add_comment,
         name="add_comment"
     ),
+    path(
+        "<username>/<int:post_id>/comment/ajax/",
+        views.add_comment_ajax,
+        name="add_comment_ajax"
+    ),
 ]
@@ -1,40 +1,66 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_POST
+from . import (
+    archive, counters, follow_graph, freshness, recommendations, search,
+    sidebar, thumbnails, timeline
+)
 from .forms import PostForm, CommentForm
 from .models import Post, Group, Follow
+from .page_cache import generational_cache_page
+from .paginator import CursorPaginator, paginate
+from yatube.db import retry_on_locked
 
 User = get_user_model()
 
 
-@cache_page(20, key_prefix='index_page')
+@generational_cache_page(60 * 5, key_prefix='index_page')
 def index(request):
-    post_list = Post.objects.all().select_related("group")
-    groups = Group.objects.all()
-    authors = User.objects.all()
-    paginator = Paginator(post_list, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    index_sidebar = sidebar.get_sidebar()
+    page, paginator = paginate(request, post_list, 5)
     return render(
         request,
         "index.html",
         {
             "page": page,
             "paginator": paginator,
-            "groups": groups,
-            "authors": authors
+            "groups": index_sidebar["groups"],
+            "authors": index_sidebar["authors"]
         }
     )
 
 
+def group_scopes(request, slug):
+    group = get_object_or_404(Group.objects.only("pk"), slug=slug)
+    return [f"group:{group.pk}"]
+
+
+def profile_scopes(request, username):
+    user = get_object_or_404(User.objects.only("pk"), username=username)
+    scopes = [f"author:{user.pk}"]
+    if request.user.is_authenticated:
+        scopes.append(f"recommendations:{request.user.pk}")
+    return scopes
+
+
+def post_scopes(request, username, post_id):
+    author_id = get_object_or_404(
+        Post.objects.values_list("author_id", flat=True),
+        author__username=username,
+        id=post_id
+    )
+    return [f"post:{post_id}", f"author:{author_id}"]
+
+
+@freshness.conditional_page(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = group.posts.for_feed()
+    page, paginator = paginate(request, posts, 10)
     return render(
         request,
         "group.html",
@@ -42,29 +68,51 @@ def group_posts(request, slug):
     )
 
 
+def search_posts(request):
+    query = request.GET.get("q", "").strip()
+    paginator = search.SearchPaginator(query, 10)
+    page = paginator.get_page(request.GET.get("cursor"))
+    return render(
+        request,
+        "search.html",
+        {"query": query, "page": page, "paginator": paginator}
+    )
+
+
+@retry_on_locked
+def save_post(post, new_image, update_fields=None):
+    """Сохраняет пост и ставит в очередь его новую картинку."""
+    post.save(update_fields=update_fields)
+    if new_image:
+        thumbnails.schedule(post)
+
+
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        save_post(post, new_image=True)
         return redirect('index')
     return render(request, 'new_post.html', {'form': form, "edit": False})
 
 
+@freshness.conditional_page(profile_scopes)
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    user_posts = user.posts.all()
-    followers = user.following.count()
-    followings = user.follower.count()
+    post_list = user.posts.for_feed()
+    stats = counters.for_user(user)
+    following = request.user.is_authenticated and (
+        follow_graph.get_graph().is_following(request.user.id, user.id)
+    )
+    recommended = []
     if request.user.is_authenticated:
-        following = user.following.filter(user=request.user).exists()
-    else:
-        following = False
-    paginator = Paginator(user_posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+        recommended = [
+            author for author in recommendations.for_user(request.user)
+            if author != user
+        ]
+    page, paginator = paginate(request, post_list, 10)
     return render(
         request,
         'profile.html',
@@ -72,36 +120,63 @@ def profile(request, username):
             "page": page,
             "paginator": paginator,
             "profile_user": user,
-            "user_posts": user_posts,
-            "followers": followers,
-            "followings": followings,
-            "following": following
+            "stats": stats,
+            "following": following,
+            "recommended": recommended
         }
     )
 
 
+@freshness.conditional_page(post_scopes)
 def post_view(request, username, post_id):
     post = get_object_or_404(
-        Post,
+        Post.objects.select_related("author", "group"),
         author__username=username,
         id=post_id
     )
-    user_posts = post.author.posts.all()
+    stats = counters.for_user(post.author)
+    following = request.user.is_authenticated and (
+        follow_graph.get_graph().is_following(request.user.id, post.author_id)
+    )
     form = CommentForm()
-    comments = post.comments.all()
+    comments, _ = comment_page(post, request.GET.get("comments"))
     return render(
         request,
         'post.html',
         {
             "profile_user": post.author,
             "post": post,
-            "user_posts": user_posts,
+            "stats": stats,
+            "following": following,
             "form": form,
-            "comments": comments
+            "comments": comments,
         }
     )
 
 
+def comment_page(post, cursor):
+    paginator = CursorPaginator(
+        post.comments.select_related("author"),
+        settings.COMMENTS_PER_PAGE,
+        order_field="created",
+    )
+    return paginator.get_page(cursor), paginator
+
+
+def post_comments(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.select_related("author"),
+        author__username=username,
+        id=post_id
+    )
+    comments, _ = comment_page(post, request.GET.get("cursor"))
+    return render(
+        request,
+        'includes/comment_list.html',
+        {"post": post, "comments": comments}
+    )
+
+
 @login_required
 def post_edit(request, username, post_id):
     current_post = get_object_or_404(
@@ -117,7 +192,14 @@ def post_edit(request, username, post_id):
         instance=current_post
     )
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        new_image = 'image' in form.changed_data
+        if new_image:
+            post.image_variants = ''
+        save_post(
+            post, new_image,
+            update_fields=[*form.Meta.fields, 'image_variants']
+        )
         return redirect('post', username=username, post_id=post_id)
     return render(
         request,
@@ -128,6 +210,20 @@ def post_edit(request, username, post_id):
     )
 
 
+@login_required
+def profile_archive(request, username):
+    if request.user.username != username:
+        return redirect('profile', username=username)
+    response = StreamingHttpResponse(
+        archive.export_user(request.user),
+        content_type="application/x-ndjson; charset=utf-8"
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{username}.jsonl"'
+    )
+    return response
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -141,6 +237,18 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
+def create_comment(request, post):
+    """Сохраняет комментарий из POST; возвращает его и форму."""
+    form = CommentForm(request.POST or None)
+    if not form.is_valid():
+        return None, form
+    comment = form.save(commit=False)
+    comment.post = post
+    comment.author = request.user
+    retry_on_locked(comment.save)()
+    return comment, form
+
+
 @login_required
 def add_comment(request, username, post_id):
     current_post = get_object_or_404(
@@ -148,49 +256,100 @@ def add_comment(request, username, post_id):
         author__username=username,
         id=post_id
     )
-    form = CommentForm(request.POST or None)
-    if form.is_valid():
-        comment = form.save(commit=False)
-        comment.post = current_post
-        comment.author = request.user
-        comment.save()
-        return redirect('post', username=username, post_id=post_id)
+    create_comment(request, current_post)
     return redirect('post', username=username, post_id=post_id)
 
 
+@login_required
+@require_POST
+def add_comment_ajax(request, username, post_id):
+    current_post = get_object_or_404(
+        Post,
+        author__username=username,
+        id=post_id
+    )
+    comment, form = create_comment(request, current_post)
+    if comment is None:
+        return JsonResponse({"errors": form.errors}, status=400)
+    return render(
+        request,
+        'includes/comment.html',
+        {"comment": comment},
+        status=201
+    )
+
+
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__user=request.user
+    post_list = timeline.feed(request.user).for_feed()
+    page, paginator = paginate(
+        request, post_list, 10, order_field="feed_date", tie_field="feed_post"
     )
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
     return render(
         request,
         "follow.html",
-        {"page": page, "paginator": paginator}
+        {
+            "page": page,
+            "paginator": paginator,
+            "recommended": recommendations.for_user(request.user)
+        }
     )
 
 
+@retry_on_locked
+def follow(user, author):
+    """Оформляет подписку, если её ещё нет."""
+    # Граф не сверяется: он может отставать от базы в обе стороны.
+    Follow.objects.get_or_create(user=user, author=author)
+
+
+@retry_on_locked
+def unfollow(user, author):
+    deleted, _ = Follow.objects.filter(user=user, author=author).delete()
+    return bool(deleted)
+
+
+def follow_state(author, following):
+    # Граф может ещё не знать о подписке, поэтому ответ строится по
+    # счётчикам.
+    return JsonResponse({
+        "following": following,
+        "followers_count": counters.for_user(author).followers_count,
+    })
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author == request.user:
         return redirect('profile', username=username)
-    if not author.following.filter(user=request.user).exists():
-        Follow.objects.create(
-            user=request.user,
-            author=author
-        )
-        return redirect('follow_index')
+    follow(request.user, author)
     return redirect('follow_index')
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    if author.following.filter(user=request.user):
-        Follow.objects.filter(user=request.user, author=author).delete()
+    if unfollow(request.user, author):
         return redirect('index')
     return redirect('profile', username=username)
+
+
+@login_required
+@require_POST
+def profile_follow_ajax(request, username):
+    author = get_object_or_404(User, username=username)
+    if author == request.user:
+        return JsonResponse(
+            {"error": "Нельзя подписаться на себя"}, status=400
+        )
+    follow(request.user, author)
+    return follow_state(author, True)
+
+
+@login_required
+@require_POST
+def profile_unfollow_ajax(request, username):
+    author = get_object_or_404(User, username=username)
+    unfollow(request.user, author)
+    return follow_state(author, False)
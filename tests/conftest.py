@@ -1,4 +1,23 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_settings(tmp_path_factory):
+    # Файл кеша и MEDIA_ROOT из настроек общие с сервером разработки,
+    # поэтому тесты работают с временными, а миниатюры строят без пула.
+    from yatube.test_runner import isolated_settings
+    with isolated_settings(str(tmp_path_factory.mktemp('yatube'))):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(isolated_settings):
+    # Кеш общий между процессами и запусками, а id объектов в тестовой
+    # базе повторяются, поэтому каждый тест начинается с пустого кеша.
+    from django.core.cache import cache
+    cache.clear()
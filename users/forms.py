@@ -1,3 +1,5 @@
+from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
 
@@ -8,3 +10,9 @@ class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ['first_name', 'last_name', 'username', 'email']
+
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        if username.lower() in settings.RESERVED_USERNAMES:
+            raise forms.ValidationError("Это имя занято адресом сайта")
+        return username
@@ -1,3 +1,21 @@
 from django.test import TestCase
 
-# Create your tests here.
+from .forms import CreationForm
+
+
+class SignUpTest(TestCase):
+    def form(self, username):
+        return CreationForm({
+            "username": username,
+            "password1": "Zq8-long-password",
+            "password2": "Zq8-long-password",
+        })
+
+    def test_reserved_usernames(self):
+        """Имена, занятые адресами сайта, не регистрируются"""
+        for username in (
+            "search", "Search", "group", "api", "rss", "atom"
+        ):
+            with self.subTest(username=username):
+                self.assertIn("username", self.form(username).errors)
+        self.assertTrue(self.form("searcher").is_valid())
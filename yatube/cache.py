@@ -0,0 +1,269 @@
+"""Кеш в файле SQLite, общий для всех процессов сервера."""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA_VERSION = 2
+
+SCHEMA = (
+    "DROP TABLE IF EXISTS cache",
+    "DROP TABLE IF EXISTS cache_totals",
+    """CREATE TABLE cache (
+        key TEXT PRIMARY KEY,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL,
+        value BLOB NOT NULL
+    )""",
+    "CREATE INDEX cache_accessed ON cache (accessed)",
+    "CREATE INDEX cache_expires ON cache (expires)",
+    """CREATE TABLE cache_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        entries INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )""",
+    "INSERT INTO cache_totals VALUES (1, 0, 0)",
+    """CREATE TRIGGER cache_inserted AFTER INSERT ON cache BEGIN
+        UPDATE cache_totals
+        SET entries = entries + 1, size = size + NEW.size;
+    END""",
+    """CREATE TRIGGER cache_deleted AFTER DELETE ON cache BEGIN
+        UPDATE cache_totals
+        SET entries = entries - 1, size = size - OLD.size;
+    END""",
+    """CREATE TRIGGER cache_resized AFTER UPDATE OF size ON cache BEGIN
+        UPDATE cache_totals SET size = size + NEW.size - OLD.size;
+    END""",
+)
+
+# Время чтения записи обновляется не чаще раза в столько секунд.
+ACCESS_RESOLUTION = 1.0
+
+
+@contextmanager
+def _transaction(db):
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get("OPTIONS", {})
+        self._max_size = int(options.get("MAX_SIZE", 256 * 2 ** 20))
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema(db)
+            self._local.db, self._local.pid = db, pid
+        return self._local.db
+
+    def _create_schema(self, db):
+        """Создаёт таблицы; кеш со старой схемой просто пересоздаётся."""
+        if db.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            return
+        with _transaction(db):
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                for statement in SCHEMA:
+                    db.execute(statement)
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _write(self):
+        return _transaction(self._db)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _insert(self, db, key, value, timeout, replace=True):
+        data = pickle.dumps(value, self.pickle_protocol)
+        expires = self.get_backend_timeout(timeout)
+        # REPLACE удалил бы старую строку без триггера cache_deleted.
+        conflict = (
+            "ON CONFLICT (key) DO UPDATE SET expires = excluded.expires, "
+            "accessed = excluded.accessed, size = excluded.size, "
+            "value = excluded.value"
+        ) if replace else "ON CONFLICT (key) DO NOTHING"
+        cursor = db.execute(
+            f"INSERT INTO cache (key, expires, accessed, size, value) "
+            f"VALUES (?, ?, ?, ?, ?) {conflict}",
+            (key, expires, time.time(), len(data), data),
+        )
+        return cursor.rowcount == 1
+
+    def _totals(self, db):
+        return db.execute(
+            "SELECT entries, size FROM cache_totals"
+        ).fetchone()
+
+    def _evict(self, db, count):
+        db.execute(
+            "DELETE FROM cache WHERE key IN ("
+            "SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+            (count,),
+        )
+
+    def _cull(self, db):
+        db.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+        count, size = self._totals(db)
+        if count <= self._max_entries and size <= self._max_size:
+            return
+        # Как в бэкендах Django, вытесняется 1/CULL_FREQUENCY записей.
+        excess = max(count - self._max_entries, 0)
+        victims = max(excess, count // self._cull_frequency, 1)
+        self._evict(db, victims)
+        while self._totals(db)[1] > self._max_size:
+            self._evict(db, victims)
+
+    def _fetch(self, keys):
+        now = time.time()
+        placeholders = ", ".join("?" * len(keys))
+        rows = self._db.execute(
+            f"SELECT key, value, expires, accessed FROM cache "
+            f"WHERE key IN ({placeholders})",
+            keys,
+        ).fetchall()
+        found, touched = {}, []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires < now:
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed > ACCESS_RESOLUTION:
+                touched.append((now, key))
+        if touched:
+            # Если база занята, отметка LRU пропускается.
+            db = self._db
+            db.execute("PRAGMA busy_timeout = 0")
+            try:
+                db.executemany(
+                    "UPDATE cache SET accessed = ? WHERE key = ?", touched
+                )
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                db.execute(
+                    f"PRAGMA busy_timeout = {int(self._busy_timeout * 1000)}"
+                )
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        found = self._fetch(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as db:
+            self._insert(db, key, value, timeout)
+            self._cull(db)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._write() as db:
+            for key, value in data.items():
+                self._insert(db, self._key(key, version), value, timeout)
+            self._cull(db)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as db:
+            db.execute(
+                "DELETE FROM cache WHERE key = ? AND expires < ?",
+                (key, time.time()),
+            )
+            added = self._insert(db, key, value, timeout, replace=False)
+            if added:
+                self._cull(db)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._write() as db:
+            row = db.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, self.pickle_protocol)
+            db.execute(
+                "UPDATE cache SET value = ?, size = ?, accessed = ? "
+                "WHERE key = ?",
+                (data, len(data), time.time(), key),
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as db:
+            cursor = db.execute(
+                "UPDATE cache SET expires = ? WHERE key = ? "
+                "AND (expires IS NULL OR expires >= ?)",
+                (self.get_backend_timeout(timeout), key, time.time()),
+            )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires >= ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._write() as db:
+            db.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_many(self, keys, version=None):
+        with self._write() as db:
+            db.executemany(
+                "DELETE FROM cache WHERE key = ?",
+                [(self._key(key, version),) for key in keys],
+            )
+
+    def clear(self):
+        with self._write() as db:
+            db.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Соединение живёт, пока жив процесс.
+        pass
@@ -0,0 +1,44 @@
+"""Настройка соединений SQLite и повтор записи в занятую базу."""
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.backends.signals import connection_created
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def is_locked(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def retry_on_locked(func=None, attempts=None, delay=None):
+    """Выполняет функцию в транзакции, повторяя её, пока база занята."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            tries = attempts or settings.SQLITE_WRITE_ATTEMPTS
+            pause = delay or settings.SQLITE_WRITE_RETRY_DELAY
+            for attempt in range(1, tries + 1):
+                try:
+                    with transaction.atomic():
+                        return func(*args, **kwargs)
+                except OperationalError as error:
+                    if attempt == tries or not is_locked(error):
+                        raise
+                    time.sleep(pause * 2 ** (attempt - 1) * random.random())
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+connection_created.connect(configure_sqlite)
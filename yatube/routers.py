@@ -0,0 +1,83 @@
+"""Запись в основную базу, чтение из реплик ``DATABASE_REPLICAS``."""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PIN_COOKIE = "db_pin"
+
+# Приложения, чтение которых никогда не уходит на реплику.
+PRIMARY_ONLY_APPS = {"sessions"}
+
+_state = threading.local()
+
+
+def pin_to_primary():
+    _state.pinned = True
+
+
+def is_pinned():
+    return getattr(_state, "pinned", False)
+
+
+def has_written():
+    return getattr(_state, "written", False)
+
+
+def reset():
+    _state.pinned = _state.written = False
+
+
+@contextmanager
+def primary():
+    """Внутри блока (или функции-декоратора) чтение идёт в ``default``."""
+    pinned = is_pinned()
+    pin_to_primary()
+    try:
+        yield
+    finally:
+        _state.pinned = pinned
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or is_pinned():
+            return "default"
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return "default"
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Всё, что поток прочитает после записи, должно её увидеть.
+        _state.written = True
+        pin_to_primary()
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaPinningMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset()
+        if PIN_COOKIE in request.COOKIES:
+            pin_to_primary()
+        try:
+            response = self.get_response(request)
+            if has_written() and settings.DATABASE_REPLICAS:
+                response.set_cookie(
+                    PIN_COOKIE, "1",
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                )
+        finally:
+            reset()
+        return response
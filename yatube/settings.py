@@ -56,6 +56,7 @@ SITE_ID = 1
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'yatube.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -99,9 +100,45 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Прагмы, которые yatube.db применяет к каждому соединению SQLite.
+
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 2 ** 20,
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
+
+# Попытки записи в занятую базу и начальная задержка между ними.
+SQLITE_WRITE_ATTEMPTS = 5
+SQLITE_WRITE_RETRY_DELAY = 0.05
+
+# Пути к репликам через двоеточие; локально их копирует sync_replicas.
+
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+    filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(':')), 1
+):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['yatube.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после записи клиент читает только из основной базы.
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -151,11 +188,106 @@ LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
 # LOGOUT_REDIRECT_URL = "index"
 
+# Имена, совпадающие с адресами сайта: профиль с таким именем был бы
+# недоступен, поэтому регистрация их не принимает.
+
+RESERVED_USERNAMES = (
+    "about", "about-author", "about-spec", "about-us", "admin", "api",
+    "atom", "auth", "follow", "group", "new", "rss", "search", "terms",
+)
+
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
+# Кеш в SQLite-файле общий для всех воркеров на сервере: в нём живут
+# страницы, сессии и хранилище миниатюр sorl-thumbnail.
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 256 * 2 ** 20,
+        },
     }
 }
+
+# Тесты очищают кеш и сохраняют картинки, поэтому запускаются с
+# временными файлом кеша и MEDIA_ROOT.
+TEST_RUNNER = 'yatube.test_runner.IsolatedTestRunner'
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+THUMBNAIL_KVSTORE = 'sorl.thumbnail.kvstores.cached_db_kvstore.KVStore'
+THUMBNAIL_CACHE = 'default'
+
+# Размеры миниатюр, которые строятся сразу после загрузки картинки:
+# имя размера -> (геометрия, параметры sorl-thumbnail).
+THUMBNAIL_SIZES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+# Варианты картинки поста для srcset: ширины в пикселях и форматы.
+# JPEG обязателен: он служит запасным для браузеров без WebP.
+IMAGE_VARIANT_WIDTHS = (320, 640, 960)
+IMAGE_VARIANT_FORMATS = ('WEBP', 'JPEG')
+IMAGE_VARIANT_SIZES = '(max-width: 992px) 100vw, 960px'
+
+# Пределы загружаемых картинок: байты, пиксели и большая сторона.
+IMAGE_MAX_UPLOAD_SIZE = 20 * 2 ** 20
+IMAGE_MAX_PIXELS = 40 * 10 ** 6
+IMAGE_MAX_SIDE = 2048
+IMAGE_QUALITY = 85
+
+# Число процессов, строящих миниатюры; 0 — строить в самом запросе.
+THUMBNAIL_WORKERS = 2
+
+# Лента «Избранных авторов»: посты авторов, у которых подписчиков больше
+# порога, не раскладываются по лентам, а подмешиваются при чтении.
+
+TIMELINE_PULL_THRESHOLD = 1000
+TIMELINE_BATCH_SIZE = 500
+
+# Сколько пропущенных изменений графа подписок проигрывать из журнала.
+
+FOLLOW_GRAPH_MAX_REPLAY = 1000
+
+# Рекомендации «на кого подписаться».
+
+RECOMMENDATIONS_COUNT = 20
+RECOMMENDATIONS_SHOWN = 5
+RECOMMENDATIONS_GROUP_WEIGHT = 2.0
+RECOMMENDATIONS_GROUP_CANDIDATES = 20
+RECOMMENDATIONS_MAX_FOLLOWERS = 5000
+
+# Сколько комментариев показывать и подгружать за один раз.
+
+COMMENTS_PER_PAGE = 20
+
+# Размер страницы лент в JSON API.
+
+API_PAGE_SIZE = 20
+
+# RSS и Atom: название сайта в заголовках, сколько последних записей в
+# ленте и сколько хранить их список в кеше.
+
+SITE_NAME = "WritTube"
+
+FEED_SIZE = 20
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Веса столбцов поиска для bm25: текст поста, сообщество, автор.
+
+SEARCH_WEIGHTS = (1.0, 0.5, 0.5)
+
+# Курсорная пагинация лент вместо ?page=N. Без этой настройки она
+# включается только для запросов с параметром ?cursor=.
+
+FEED_CURSOR_PAGINATION = False
+
+# Боковая колонка главной страницы: сколько сообществ и авторов
+# показывать и сколько секунд хранить собранную колонку в кеше.
+
+SIDEBAR_LIMIT = 20
+SIDEBAR_CACHE_TIMEOUT = 60 * 60
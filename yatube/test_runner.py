@@ -0,0 +1,37 @@
+"""Запуск тестов с временными файлом кеша и ``MEDIA_ROOT``."""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+def isolated_settings(directory):
+    """Настройки, в которых кеш и медиафайлы лежат в ``directory``."""
+    caches = {}
+    for alias, options in settings.CACHES.items():
+        caches[alias] = dict(options)
+        if options["BACKEND"] == "yatube.cache.SQLiteCache":
+            caches[alias]["LOCATION"] = os.path.join(
+                directory, f"{alias}.sqlite3"
+            )
+    return override_settings(
+        CACHES=caches,
+        MEDIA_ROOT=os.path.join(directory, "media"),
+        THUMBNAIL_WORKERS=0,
+    )
+
+
+class IsolatedTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_directory = tempfile.mkdtemp()
+        self.isolated_settings = isolated_settings(self.test_directory)
+        self.isolated_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated_settings.disable()
+        shutil.rmtree(self.test_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
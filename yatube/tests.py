@@ -1,4 +1,24 @@
-from django.test import TestCase, Client
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import TestCase, Client, RequestFactory, override_settings
+
+from posts import feeds, follow_graph, freshness, sidebar
+from posts.management.commands.sync_replicas import copy_database
+from posts.models import Post
+from . import db, routers
+from .cache import SQLiteCache
+
+User = get_user_model()
 
 
 class PagesTest(TestCase):
@@ -8,3 +28,223 @@ class PagesTest(TestCase):
     def test_404(self):
         response = self.client.get('/my_posts/')
         self.assertEqual(response.status_code, 404)
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.location = os.path.join(directory, "cache.sqlite3")
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {"OPTIONS": options})
+
+    def test_set_get_delete(self):
+        self.cache.set("ключ", {"значение": [1, 2]})
+        self.assertEqual(self.cache.get("ключ"), {"значение": [1, 2]})
+        self.assertEqual(
+            self.cache.get_many(["ключ", "нет"]),
+            {"ключ": {"значение": [1, 2]}}
+        )
+        self.cache.delete("ключ")
+        self.assertIsNone(self.cache.get("ключ"))
+
+    def test_expiry(self):
+        self.cache.set("ключ", 1, timeout=-1)
+        self.assertIsNone(self.cache.get("ключ"))
+        self.assertTrue(self.cache.add("ключ", 2))
+        self.assertFalse(self.cache.add("ключ", 3))
+        self.assertEqual(self.cache.get("ключ"), 2)
+
+    def test_incr(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr("счётчик")
+        self.cache.set("счётчик", 1)
+        self.assertEqual(self.cache.incr("счётчик", 5), 6)
+        self.assertEqual(self.cache.decr("счётчик"), 5)
+
+    def test_lru_eviction(self):
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3)
+        for number in range(3):
+            cache.set(f"ключ{number}", number)
+        with mock.patch("yatube.cache.ACCESS_RESOLUTION", -1):
+            cache.get("ключ0")
+        cache.set("ключ3", 3)
+        self.assertEqual(cache.get("ключ0"), 0)
+        self.assertIsNone(cache.get("ключ1"))
+        self.assertEqual(cache.get("ключ3"), 3)
+
+    def test_size_limit(self):
+        cache = self.make_cache(MAX_SIZE=2000)
+        for number in range(5):
+            cache.set(f"ключ{number}", b"x" * 900)
+        self.assertIsNone(cache.get("ключ0"))
+        self.assertIsNotNone(cache.get("ключ4"))
+
+    def test_totals(self):
+        """Число и размер записей ведутся без обхода таблицы"""
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3)
+        for number in range(5):
+            cache.set(f"ключ{number}", b"x" * number * 100)
+        cache.set("ключ4", b"y")
+        cache.add("ключ5", 1)
+        cache.incr("ключ5", 10 ** 20)
+        cache.delete("ключ4")
+        db = cache._db
+        self.assertEqual(
+            cache._totals(db),
+            db.execute("SELECT COUNT(*), TOTAL(size) FROM cache").fetchone()
+        )
+
+    def test_old_schema(self):
+        """Файл кеша со старой схемой пересоздаётся"""
+        db = sqlite3.connect(self.location)
+        db.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value BLOB)")
+        db.commit()
+        db.close()
+        cache = self.make_cache()
+        cache.set("ключ", 1)
+        self.assertEqual(cache.get("ключ"), 1)
+
+    def test_read_does_not_wait_for_writer(self):
+        """Отметка LRU не ждёт чужую транзакцию записи"""
+        cache = self.make_cache(BUSY_TIMEOUT=2)
+        cache.set("ключ", 1)
+        writer = sqlite3.connect(self.location, isolation_level=None)
+        self.addCleanup(writer.close)
+        writer.execute("BEGIN IMMEDIATE")
+        started = time.monotonic()
+        with mock.patch("yatube.cache.ACCESS_RESOLUTION", -1):
+            self.assertEqual(cache.get("ключ"), 1)
+        self.assertLess(time.monotonic() - started, 1)
+        writer.execute("ROLLBACK")
+
+    def test_shared_between_processes(self):
+        self.cache.set("счётчик", 0)
+        workers = [
+            multiprocessing.Process(target=increment, args=(self.location,))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get("счётчик"), 4 * 50)
+
+
+def increment(location):
+    cache = SQLiteCache(location, {})
+    for _ in range(50):
+        cache.incr("счётчик")
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class PrimaryReplicaRouterTest(TestCase):
+    def setUp(self):
+        routers.reset()
+        self.router = routers.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), "replica")
+        self.assertEqual(self.router.db_for_read(Session), "default")
+        self.assertEqual(self.router.db_for_write(Post), "default")
+
+    def test_reads_after_write_stick_to_primary(self):
+        self.router.db_for_write(Post)
+        self.assertEqual(self.router.db_for_read(Post), "default")
+
+    def test_primary_block(self):
+        with routers.primary():
+            self.assertEqual(self.router.db_for_read(Post), "default")
+        self.assertEqual(self.router.db_for_read(Post), "replica")
+
+    def test_cache_rebuilds_read_primary(self):
+        """Данные для общего кеша не читаются с реплики"""
+        # Базы «replica» нет, поэтому чтение с неё упало бы.
+        Post.objects.using("default").create(
+            text="пост", author=User.objects.create_user(username="leo")
+        )
+        routers.reset()
+        self.assertEqual(len(feeds.build("index")), 1)
+        self.assertEqual(len(sidebar.build()["authors"]), 1)
+        self.assertIsNotNone(freshness.stamps(["index"])[0][0])
+        self.assertEqual(follow_graph.FollowGraph.load().following(1), ())
+        response = self.client.get("/")
+        self.assertContains(response, "пост")
+
+    def test_pin_cookie(self):
+        def write_view(request):
+            self.router.db_for_write(Post)
+            return HttpResponse()
+
+        def read_view(request):
+            return HttpResponse(self.router.db_for_read(Post))
+
+        response = routers.ReplicaPinningMiddleware(write_view)(
+            self.factory.post("/")
+        )
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_read(Post), "replica")
+
+        request = self.factory.get("/")
+        request.COOKIES[routers.PIN_COOKIE] = "1"
+        response = routers.ReplicaPinningMiddleware(read_view)(request)
+        self.assertEqual(response.content, b"default")
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_copy_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, "primary.sqlite3")
+        target = os.path.join(directory, "replica.sqlite3")
+        with sqlite3.connect(source) as db:
+            db.execute("CREATE TABLE post (text TEXT)")
+            db.execute("INSERT INTO post VALUES ('скопировано')")
+        copy_database(source, target)
+        with sqlite3.connect(target) as db:
+            rows = db.execute("SELECT text FROM post").fetchall()
+        self.assertEqual(rows, [("скопировано",)])
+
+
+class SQLiteProfileTest(TestCase):
+    def test_pragmas_applied(self):
+        """Новое соединение получает прагмы из SQLITE_PRAGMAS"""
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_retry_on_locked(self):
+        """Запись, упёршаяся в блокировку, повторяется"""
+        calls = mock.Mock(side_effect=[
+            OperationalError("database is locked"),
+            OperationalError("database is locked"),
+            "ok",
+        ])
+        self.assertEqual(db.retry_on_locked(calls, delay=0.001)(), "ok")
+        self.assertEqual(calls.call_count, 3)
+
+    def test_retry_gives_up(self):
+        """Другие ошибки и исчерпанные попытки пробрасываются сразу"""
+        calls = mock.Mock(side_effect=OperationalError("no such table"))
+        with self.assertRaises(OperationalError):
+            db.retry_on_locked(calls)()
+        self.assertEqual(calls.call_count, 1)
+
+        calls = mock.Mock(side_effect=OperationalError("database is locked"))
+        with self.assertRaises(OperationalError):
+            db.retry_on_locked(calls, attempts=2, delay=0.001)()
+        self.assertEqual(calls.call_count, 2)
+
+    def test_render_not_retried(self):
+        """Повторяется только запись, а не отрисовка страницы"""
+        self.client.force_login(User.objects.create_user(username="leo"))
+        locked = OperationalError("database is locked")
+        with mock.patch("posts.views.render", side_effect=locked) as render:
+            with self.assertRaises(OperationalError):
+                self.client.get("/new/")
+        pages = [args[1] for args, _ in render.call_args_list]
+        self.assertEqual(pages.count("new_post.html"), 1)